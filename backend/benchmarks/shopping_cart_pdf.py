@@ -0,0 +1,42 @@
+"""
+Микро-бенчмарк формирования pdf файла корзины.
+
+Запуск из директории backend:
+    python benchmarks/shopping_cart_pdf.py
+"""
+import os
+import sys
+import timeit
+from io import BytesIO
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'foodgram'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+from api.pdf import get_background, render_shopping_cart  # noqa: E402
+
+CART_SIZES = (10, 100, 1000)
+REPEAT = 5
+
+
+def make_cart(size: int) -> list:
+    return [
+        {'name': f'Ингредиент {i}', 'measurement_unit': 'г',
+         'total_amount': i * 10}
+        for i in range(size)
+    ]
+
+
+def main() -> None:
+    started = timeit.default_timer()
+    get_background()
+    print(f'загрузка ресурсов: {timeit.default_timer() - started:.4f} s')
+
+    for size in CART_SIZES:
+        cart = make_cart(size)
+        timer = timeit.Timer(lambda: render_shopping_cart(cart, BytesIO()))
+        best = min(timer.repeat(repeat=REPEAT, number=1))
+        print(f'{size:>5} ингредиентов: {best * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional
+
+from recipes.catalog import INGREDIENTS_CATALOG, get_catalog_version
+from recipes.models import Ingredient
+
+AUTOCOMPLETE_LIMIT = 20
+MIN_TYPO_QUERY_LENGTH = 3
+MAX_CHAR = chr(0x10FFFF)
+
+
+def get_max_distance(query: str) -> int:
+    """Сколько опечаток допускаем в запросе в зависимости от его длины."""
+    if len(query) < MIN_TYPO_QUERY_LENGTH:
+        return 0
+    return 1 if len(query) <= 5 else 2
+
+
+def next_row(row: List[int], query: str, char: str) -> List[int]:
+    """Следующая строка матрицы Левенштейна для query после символа char."""
+    current = [row[0] + 1]
+    for i, query_char in enumerate(query, 1):
+        current.append(min(
+            row[i] + 1,
+            current[i - 1] + 1,
+            row[i - 1] + (query_char != char)))
+    return current
+
+
+class IngredientIndex:
+    """
+    Индекс справочника ингредиентов в памяти процесса.
+    Attributes:
+        - keys: отсортированные названия в нижнем регистре (casefold)
+        - items: ингредиенты в том же порядке, что и keys
+        - ids: множество id ингредиентов
+        - text: keys, склеенные через перевод строки, для поиска подстроки
+        - offsets: начало каждого key в text
+    """
+    def __init__(self, ingredients: Iterable[tuple]):
+        rows = sorted(
+            (name.casefold(), id, name, measurement_unit)
+            for id, name, measurement_unit in ingredients)
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for _, id, name, measurement_unit in rows]
+        self.ids = {item['id'] for item in self.items}
+        self.text = '\n'.join(self.keys)
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List:
+        """
+        Поиск ингредиентов по названию, результаты по убыванию релевантности:
+            - Совпадение с началом названия (бинарный поиск по keys)
+            - Вхождение подстроки в название
+            - Начало названия с опечатками, сначала ближайшие
+        """
+        query = query.strip().casefold()
+        if not query:
+            return self.items[:limit]
+
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + MAX_CHAR, start)
+        found = list(range(start, min(end, start + limit)))
+
+        if len(found) < limit:
+            found += self.search_substring(
+                query, limit - len(found), range(start, end))
+
+        max_distance = get_max_distance(query)
+        if len(found) < limit and max_distance:
+            found += self.search_typos(
+                query, max_distance, set(found))[:limit - len(found)]
+
+        return [self.items[position] for position in found]
+
+    def search_substring(self, query: str, limit: int,
+                         exclude: range) -> List[int]:
+        """Позиции названий, содержащих query, поиск по склеенному text."""
+        found = []
+        index = self.text.find(query)
+        while index != -1 and len(found) < limit:
+            position = bisect_right(self.offsets, index) - 1
+            if position not in exclude:
+                found.append(position)
+            if position + 1 == len(self.offsets):
+                break
+            index = self.text.find(query, self.offsets[position + 1])
+        return found
+
+    def search_typos(self, query: str, max_distance: int,
+                     exclude: set) -> List[int]:
+        """
+        Позиции названий, начало которых отличается от query не больше чем
+        на max_distance правок, сначала ближайшие. Первую букву считаем
+        верной и проверяем только ее диапазон keys.
+        Отсортированные keys обходим как префиксное дерево: у названий с
+        общим префиксом строки матрицы Левенштейна общие, ветки, где
+        расстояние уже больше max_distance, отбрасываем.
+        """
+        start = bisect_left(self.keys, query[0])
+        end = bisect_left(self.keys, query[0] + MAX_CHAR, start)
+        distances = {}
+        self.walk_typos(query, max_distance, 1, start, end,
+                        next_row(list(range(len(query) + 1)), query, query[0]),
+                        distances)
+        return [
+            position for position, _ in sorted(
+                distances.items(), key=lambda item: (item[1], item[0]))
+            if position not in exclude
+        ]
+
+    def walk_typos(self, query: str, max_distance: int, depth: int,
+                   start: int, end: int, row: List[int],
+                   distances: dict) -> None:
+        """Обход keys[start:end] с общим префиксом длины depth."""
+        position = start
+        while position < end:
+            key = self.keys[position]
+            if len(key) <= depth:
+                position += 1
+                continue
+            child_end = bisect_left(
+                self.keys, key[:depth + 1] + MAX_CHAR, position, end)
+            child_row = next_row(row, query, key[depth])
+            if child_row[-1] <= max_distance:
+                for child in range(position, child_end):
+                    distances[child] = min(
+                        distances.get(child, child_row[-1]), child_row[-1])
+            if min(child_row) < min(child_row[-1], max_distance + 1):
+                self.walk_typos(query, max_distance, depth + 1,
+                                position, child_end, child_row, distances)
+            position = child_end
+
+
+class IngredientAutocomplete:
+    """
+    Индекс ингредиентов, закешированный в процессе.
+    Перестраивается, когда меняется версия справочника ингредиентов.
+    """
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.index: Optional[IngredientIndex] = None
+
+    def get_index(self) -> IngredientIndex:
+        version = get_catalog_version(INGREDIENTS_CATALOG)
+        if self.index is None or self.version != version:
+            self.index = IngredientIndex(Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'))
+            self.version = version
+        return self.index
+
+    def get_built_index(self) -> Optional[IngredientIndex]:
+        """Индекс, только если он уже построен для текущей версии."""
+        if self.version != get_catalog_version(INGREDIENTS_CATALOG):
+            return None
+        return self.index
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List:
+        return self.get_index().search(query, limit)
+
+
+ingredient_autocomplete = IngredientAutocomplete()
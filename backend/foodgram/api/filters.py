@@ -1,30 +1,57 @@
-from django.db.models import Count, Q
+from django.db.models import Exists, OuterRef
 from django.db.models.query import QuerySet
 from django_filters import rest_framework as filter
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.models import Ingredient, Recipe, RecipeTag
+from recipes.rankings import order_by_popular
+from recipes.search import search_recipes
+
+from .autocomplete import ingredient_autocomplete
+
+TAGS_MODE_ALL = 'all'
+TAGS_MODE_ANY = 'any'
+TAGS_MODES = (
+    (TAGS_MODE_ALL, 'Рецепты со всеми тегами'),
+    (TAGS_MODE_ANY, 'Рецепты хотя бы с одним из тегов'),
+)
+ORDERING_POPULAR = 'popular'
+ORDERINGS = (
+    (ORDERING_POPULAR, 'Сначала популярные'),
+)
 
 
 class IngredientFilter(filter.FilterSet):
-    """Фильтрация ингредиента по названию или по части названия."""
+    """
+    Фильтрация ингредиента по названию или по части названия.
+    Поиск выполняется по индексу ингредиентов в памяти процесса.
+    """
     search_title = ('Name')
     search_description = ('Search ingredient by part of name')
 
-    name = filter.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',)
+    name = filter.CharFilter(method='filter_name',)
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(
+            self,
+            queryset: QuerySet,
+            name: str, value: str) -> QuerySet:
+        """Фильтруем по id найденных в индексе ингредиентов."""
+        ids = [item['id'] for item in ingredient_autocomplete.search(value)]
+        return queryset.filter(id__in=ids)
+
 
 class RecipeFilter(filter.FilterSet):
     """
     Фильтрация рецептов по:
         - Автору
-        - Тэгам
+        - Тэгам (tags_mode=all|any)
         - Избранным рецептам
         - Рецептам в корзине
+        - Полнотекстовому поиску search по названию, описанию, тегам и
+          ингредиентам, сначала самые релевантные
+    Сортировка ordering=popular - по таблице рейтингов RecipeRanking.
     """
     is_favorited = filter.BooleanFilter(
         method='filter_is_favorited',)
@@ -32,46 +59,85 @@ class RecipeFilter(filter.FilterSet):
         method='filter_is_in_shopping_cart',)
     author = filter.NumberFilter(field_name='author__id',)
     tags = filter.CharFilter(method='filter_tags',)
+    tags_mode = filter.ChoiceFilter(
+        choices=TAGS_MODES,
+        method='filter_tags_mode',
+        empty_label=None,)
+    search = filter.CharFilter(method='filter_search',)
+    ordering = filter.ChoiceFilter(
+        choices=ORDERINGS,
+        method='filter_ordering',)
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart', )
+        fields = ('author', 'tags', 'tags_mode', 'is_favorited',
+                  'is_in_shopping_cart', 'search', 'ordering', )
 
     def filter_tags(
             self,
             queryset: QuerySet,
             name: str, value: str) -> QuerySet:
         """
-        Создаем список slug-ов по которым необходима фильтрация.
-        К каждому объекту queryset-а анотируем колличество slug-ов в поле tag.
-        Фильтруем по tag-ам из запроса и по их количеству.
+        Собираем slug-и из всех параметров tags (?tags=a&tags=b, 'a,b' и
+        'a&tags=b'). Каждое условие - EXISTS по индексу RecipeTag, без
+        GROUP BY по всем рецептам:
+            - tags_mode=all (по умолчанию): рецепт с каждым из тегов
+            - tags_mode=any: рецепт хотя бы с одним из тегов
         """
-        tags = value.split('&tags=')
-        return queryset.annotate(num_tags=Count(
-            'tags__slug',
-            filter=Q(tags__slug__in=tags),
-            distinct=True)).filter(num_tags=len(tags), tags__slug__in=tags)
+        slugs = {
+            slug
+            for param in self.data.getlist(name)
+            for part in param.split('&tags=')
+            for slug in part.split(',') if slug
+        }
+        if not slugs:
+            return queryset
+
+        if self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ANY:
+            return queryset.filter(Exists(RecipeTag.objects.filter(
+                recipe=OuterRef('pk'), tag__slug__in=slugs)))
+
+        for slug in slugs:
+            queryset = queryset.filter(Exists(RecipeTag.objects.filter(
+                recipe=OuterRef('pk'), tag__slug=slug)))
+        return queryset
+
+    def filter_tags_mode(
+            self,
+            queryset: QuerySet,
+            name: str, value: str) -> QuerySet:
+        """Режим применяется в filter_tags."""
+        return queryset
+
+    def filter_search(
+            self,
+            queryset: QuerySet,
+            name: str, value: str) -> QuerySet:
+        """Поиск по search_document, см. recipes.search.search_recipes."""
+        return search_recipes(queryset, value)
+
+    def filter_ordering(
+            self,
+            queryset: QuerySet,
+            name: str, value: str) -> QuerySet:
+        return order_by_popular(queryset)
 
     def filter_is_favorited(
             self,
             queryset: QuerySet,
             name: str, value: bool) -> QuerySet:
-        """Фильтруем по id рецепта привязанного к пользователю."""
+        """Фильтруем по аннотации из RecipeSerivce.get_recipes."""
         user = self.request.user
         if not user.is_anonymous and value:
-            ids = Favorite.objects.filter(
-                user=user).values_list('recipe_id', flat=True)
-            return queryset.filter(id__in=ids)
+            return queryset.filter(is_favorited=True)
         return queryset.none()
 
     def filter_is_in_shopping_cart(
             self,
             queryset: QuerySet,
             name: str, value: bool) -> QuerySet:
-        """Фильтруем по id рецепта привязанного к пользователю."""
+        """Фильтруем по аннотации из RecipeSerivce.get_recipes."""
         user = self.request.user
         if not user.is_anonymous and value:
-            ids = ShoppingCart.objects.filter(
-                user=user).values_list('recipe_id', flat=True)
-            return queryset.filter(id__in=ids)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset.none()
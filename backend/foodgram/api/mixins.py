@@ -0,0 +1,151 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from recipes.catalog import get_catalog_version, get_catalog_versions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+NS_IN_SECOND = 10 ** 9
+
+
+class CatalogListMixin:
+    """
+    Список всего справочника с кешированием по версии справочника:
+        - ETag и Last-Modified строятся из версии справочника catalog
+        - На условный GET с актуальной версией отвечаем 304
+        - json ответа кешируется на версию, полный список - одно чтение
+          из кеша
+    Запросы с параметрами (фильтрация) обрабатываются как обычно.
+    """
+    catalog = None
+
+    def list(self, request: Request, *args, **kwargs) -> HttpResponse:
+        if set(request.query_params) - {'format'}:
+            return super().list(request, *args, **kwargs)
+        if request.accepted_renderer.format != JSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        version = get_catalog_version(self.catalog)
+        etag = quote_etag(f'{self.catalog}-{version}')
+        last_modified = version // NS_IN_SECOND
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(
+                self.get_catalog_body(version),
+                content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_catalog_body(self, version: int) -> bytes:
+        key = f'catalog_body:{self.catalog}:{version}'
+        body = cache.get(key)
+        if body is None:
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            body = JSONRenderer().render(serializer.data)
+            cache.set(key, body, CATALOG_CACHE_TIMEOUT)
+        return body
+
+
+class StreamingListMixin:
+    """
+    Большие страницы списка (?limit= больше stream_page_size пагинатора)
+    сериализуются частями из queryset.iterator() и отдаются потоком,
+    вся страница в памяти не собирается. Остальные запросы - как обычно.
+    """
+    def list(self, request: Request, *args, **kwargs) -> HttpResponse:
+        if not self.paginator.is_streamed(request):
+            return super().list(request, *args, **kwargs)
+        objects = self.paginator.paginate_queryset_lazy(
+            self.filter_queryset(self.get_queryset()), request)
+        return self.paginator.get_streaming_response(
+            objects,
+            lambda chunk: self.get_serializer(chunk, many=True).data)
+
+
+class ResponseCacheMixin:
+    """
+    Общий кеш json ответов list и retrieve:
+        - Ключ - хост, путь, нормализованные параметры запроса и версии
+          справочников response_cache_catalogs
+        - В кеше лежит ответ, не зависящий от пользователя (как для
+          анонимного), авторизованному пользователю его данные
+          накладываются в apply_user_state
+        - Изменение справочника меняет его версию, старые ответы
+          перестают читаться и истекают через RESPONSE_CACHE_TIMEOUT
+        - Запросы с параметрами response_cache_user_params у
+          авторизованных пользователей, потоковые ответы и ответы
+          не 200 не кешируются
+    """
+    response_cache_catalogs = ()
+    response_cache_user_params = ()
+    response_cache_shared = False
+
+    def list(self, request: Request, *args, **kwargs) -> HttpResponse:
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request: Request, *args, **kwargs) -> HttpResponse:
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def is_response_cacheable(self, request: Request) -> bool:
+        if request.accepted_renderer.format != JSONRenderer.format:
+            return False
+        if self.paginator is not None and self.paginator.is_streamed(
+                request):
+            return False
+        return request.user.is_anonymous or not any(
+            key in request.query_params
+            for key in self.response_cache_user_params)
+
+    def get_response_cache_key(self, request: Request) -> str:
+        params = sorted(
+            (key, sorted(request.query_params.getlist(key)))
+            for key in request.query_params)
+        versions = get_catalog_versions(self.response_cache_catalogs)
+        digest = hashlib.md5(repr(
+            (request.get_host(), request.path, params)).encode()).hexdigest()
+        return f'response:{"-".join(map(str, versions))}:{digest}'
+
+    def apply_user_state(self, data, request: Request):
+        """Данные пользователя в общем ответе, по умолчанию их нет."""
+        return data
+
+    def get_user_response(self, body: bytes,
+                          request: Request) -> HttpResponse:
+        if not request.user.is_anonymous:
+            body = JSONRenderer().render(
+                self.apply_user_state(json.loads(body), request))
+        return HttpResponse(body, content_type='application/json')
+
+    def get_cached_response(self, handler, request: Request,
+                            *args, **kwargs) -> HttpResponse:
+        """
+        Ответ из кеша, при промахе - ответ handler, который
+        формируется без данных пользователя (response_cache_shared).
+        """
+        if not self.is_response_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        body = cache.get(key)
+        if body is not None:
+            return self.get_user_response(body, request)
+
+        self.response_cache_shared = True
+        response = handler(request, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == 200:
+            body = JSONRenderer().render(response.data)
+            cache.set(key, body, settings.RESPONSE_CACHE_TIMEOUT)
+            return self.get_user_response(body, request)
+        return response
@@ -0,0 +1,94 @@
+import os
+from functools import lru_cache
+from typing import BinaryIO, Iterable
+
+from django.conf import settings
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+PATH_TO_CART_ASSETS = os.path.join(settings.BASE_DIR, 'static/download_cart')
+FONT_NAME = 'Arial'
+FONT_SIZE = 18
+PAGE_TEMPLATE = 'shopping_cart_page'
+NAME_X = 50
+AMOUNT_X = 400
+HEADER_Y = 780
+FIRST_ROW_Y = 750
+LAST_ROW_Y = 50
+ROW_HEIGHT = 20
+ROWS_PER_PAGE = (FIRST_ROW_Y - LAST_ROW_Y) // ROW_HEIGHT + 1
+
+# Бинарные потоки без ASCII85: картинка фона не перекодируется
+# в каждом документе и файл получается меньше.
+rl_config.useA85 = 0
+
+
+class BackgroundReader(ImageReader):
+    """
+    ImageReader для jpeg фона.
+    Canvas.drawImage подписывает картинку md5 от RGB данных в каждом
+    документе, jpeg при этом встраивается как есть. Подписываем картинку
+    именем файла, как при передаче пути в drawImage.
+    """
+    _dataA = None  # noqa: N815
+
+    def getRGBData(self) -> bytes:  # noqa: N802
+        return self.fileName.encode()
+
+
+@lru_cache(maxsize=None)
+def get_background() -> BackgroundReader:
+    """
+    Ресурсы pdf файла загружаются один раз на процесс:
+        - Регистрируем шрифт Arial в pdfmetrics
+        - Читаем картинку фона в память, ImageReader кеширует ее данные
+    """
+    pdfmetrics.registerFont(
+        TTFont(FONT_NAME, os.path.join(PATH_TO_CART_ASSETS, 'arial.ttf')))
+    return BackgroundReader(
+        os.path.join(PATH_TO_CART_ASSETS, 'download.jpg'))
+
+
+def draw_page_template(file: Canvas) -> None:
+    """Шаблон страницы: фон и заголовки колонок, рисуется один раз."""
+    file.beginForm(PAGE_TEMPLATE)
+    file.drawImage(get_background(), 0, -400)
+    file.setFont(FONT_NAME, FONT_SIZE)
+    file.drawString(NAME_X, HEADER_Y, 'Наименование')
+    file.drawString(AMOUNT_X, HEADER_Y, 'Количество')
+    file.endForm()
+
+
+def render_shopping_cart(ingredients: Iterable[dict],
+                         output: BinaryIO) -> None:
+    """
+    Функция для создания pdf файла ингредиентов для покупки.
+        - Создаем pdf file в output используя Canvas
+        - Каждая страница ссылается на шаблон с фоном и заголовками
+        - Записываем агрегированные ингредиенты из get_cart_ingredients,
+          по ROWS_PER_PAGE строк на страницу
+    """
+    file = Canvas(output)
+    draw_page_template(file)
+
+    row = 0
+    for obj in ingredients:
+        if row % ROWS_PER_PAGE == 0:
+            if row:
+                file.showPage()
+            file.doForm(PAGE_TEMPLATE)
+            file.setFont(FONT_NAME, FONT_SIZE)
+
+        y = FIRST_ROW_Y - row % ROWS_PER_PAGE * ROW_HEIGHT
+        file.drawString(NAME_X, y, obj['name'])
+        file.drawString(
+            AMOUNT_X, y, f'{obj["total_amount"]} {obj["measurement_unit"]}')
+        row += 1
+
+    if not row:
+        file.doForm(PAGE_TEMPLATE)
+    file.showPage()
+    file.save()
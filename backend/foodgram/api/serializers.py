@@ -1,15 +1,18 @@
-from base64 import b64decode
+from binascii import Error as BinasciiError
 from collections import OrderedDict
 
-from django.core.files.base import ContentFile
-from recipes.models import (AmountIngredient, Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
-from rest_framework.serializers import (ImageField, ModelSerializer,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField)
-from users.models import Follow, User
+from django.conf import settings
+from django.core.files.storage import default_storage
+from recipes.images import IMAGE_FORMATS, IMAGE_VARIANTS
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+from rest_framework.relations import MANY_RELATION_KWARGS, ManyRelatedField
+from rest_framework.serializers import (BooleanField, Field, ImageField,
+                                        ModelSerializer,
+                                        PrimaryKeyRelatedField, ReadOnlyField)
+from users.models import User
 
 from .services import RecipeSerivce
+from .uploads import decode_base64_file, get_decoded_size
 
 
 class IngredientInfoSerializer(ModelSerializer):
@@ -39,55 +42,136 @@ class AmountIngredientSerializer(ModelSerializer):
 
 class AuthorSerializer(ModelSerializer):
     """
-    Сериализация пользователей.
-    В методе to_representation добавляем информацию о подписке на пользователя.
+    Сериализация автора рецепта.
+    Информацию о подписке добавляет RecipeSerializer из аннотации queryset-а.
     """
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name')
 
-    def to_representation(self, instance: User) -> OrderedDict:
-        data = super().to_representation(instance)
-        user = self.context.get('request').user.id
-        data['is_subscribed'] = Follow.objects.filter(
-            user=user, following=instance).exists()
-        return data
+
+class BatchedManyRelatedField(ManyRelatedField):
+    """
+    Список объектов по первичным ключам одним IN запросом вместо запроса
+    на каждый ключ, несуществующие ключи возвращаются в одной ошибке.
+    """
+    default_error_messages = {
+        **ManyRelatedField.default_error_messages,
+        'does_not_exist': 'Объекты с id {pk_values} не найдены.',
+        'incorrect_type': 'Некорректный тип. Ожидалось значение первичного '
+                          'ключа, получен {data_type}.',
+    }
+
+    def to_internal_value(self, data: list) -> list:
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        try:
+            pks = list(dict.fromkeys(int(pk) for pk in data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        objects = self.child_relation.get_queryset().in_bulk(pks)
+        missing = [pk for pk in pks if pk not in objects]
+        if missing:
+            self.fail('does_not_exist', pk_values=missing)
+        return [objects[pk] for pk in pks]
+
+
+class BatchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, который при many=True проверяет ключи пачкой."""
+    @classmethod
+    def many_init(cls, *args, **kwargs) -> BatchedManyRelatedField:
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
 
 
 class Base64ImageField(ImageField):
     """
-    Декодировка картинки из base64.
+    Декодировка картинки из base64 или файл из multipart запроса.
     - Из исходной строки извлекаем формат и картинку.
+    - Размер проверяем по длине строки до декодирования.
     - Записываем картинку в формате 'recipe.<расширение>.
     """
+    default_error_messages = {
+        **ImageField.default_error_messages,
+        'max_size': 'Размер картинки больше {max_size} байт.',
+    }
+
     def to_internal_value(self, data: str) -> str:
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, separator, imgstr = data.partition(';base64,')
+            if not separator:
+                self.fail('invalid_image')
+            if get_decoded_size(imgstr) > settings.MAX_IMAGE_SIZE:
+                self.fail('max_size', max_size=settings.MAX_IMAGE_SIZE)
             ext = format.split('/')[-1]
-            data = ContentFile(b64decode(imgstr), name=f'recipe.{ext}')
+            try:
+                data = decode_base64_file(
+                    imgstr, f'recipe.{ext}', format.split(':')[-1])
+            except BinasciiError:
+                self.fail('invalid_image')
         return super().to_internal_value(data)
 
 
+class ImageSrcsetField(Field):
+    """
+    Варианты картинки рецепта в формате srcset для каждого формата:
+    {"webp": "<url> 160w, <url> 480w, ...", "jpeg": "..."}.
+    Пока варианты не построены - пустой словарь, остается image.
+    """
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_variants'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants: dict) -> dict:
+        request = self.context.get('request')
+        srcset = {}
+        for ext in IMAGE_FORMATS:
+            urls = []
+            for variant in IMAGE_VARIANTS:
+                if variant not in variants:
+                    continue
+                url = default_storage.url(variants[variant][ext])
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls.append(f'{url} {variants[variant]["width"]}w')
+            if urls:
+                srcset[ext] = ', '.join(urls)
+        return srcset
+
+
 class RecipeSerializer(ModelSerializer):
-    """Сериализцаия рецептов для метода GET."""
+    """
+    Сериализцаия рецептов для метода GET.
+    Поля is_favorited, is_in_shopping_cart и author_is_subscribed читаются
+    из аннотаций RecipeSerivce.get_recipes, без запросов на каждый рецепт,
+    favorites_count и in_carts_count - счетчики рецепта.
+    """
     author = AuthorSerializer(read_only=True)
     tags = TagSerializer(read_only=True, many=True)
     ingredients = AmountIngredientSerializer(
         read_only=True, many=True, source='amountingredient_set')
-    is_favorited = SerializerMethodField()
-    is_in_shopping_cart = SerializerMethodField()
+    is_favorited = BooleanField(read_only=True)
+    is_in_shopping_cart = BooleanField(read_only=True)
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time',)
+                  'is_in_shopping_cart', 'name', 'image', 'image_srcset',
+                  'text', 'cooking_time', 'favorites_count',
+                  'in_carts_count',)
 
-    def get_is_favorited(self, obj: Recipe) -> Favorite:
-        return RecipeSerivce.get_favorite(self, obj)
-
-    def get_is_in_shopping_cart(self, obj: Recipe) -> ShoppingCart:
-        return RecipeSerivce.get_shopping_cart(self, obj)
+    def to_representation(self, instance: Recipe) -> OrderedDict:
+        data = super().to_representation(instance)
+        data['author']['is_subscribed'] = instance.author_is_subscribed
+        return data
 
 
 class RecipeCreateSerializer(ModelSerializer):
@@ -95,8 +179,8 @@ class RecipeCreateSerializer(ModelSerializer):
     image = Base64ImageField(required=True, allow_empty_file=False)
     ingredients = AmountIngredientSerializer(
         read_only=True, many=True, source='amountingredient_set')
-    tags = PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all(),
-                                  required=True)
+    tags = BatchedPrimaryKeyRelatedField(
+        many=True, queryset=Tag.objects.all(), required=True)
 
     class Meta:
         model = Recipe
@@ -115,9 +199,12 @@ class RecipeCreateSerializer(ModelSerializer):
 
 class RecipeShortSerializer(ModelSerializer):
     """Краткая информация о рецепте."""
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time',
+                  'favorites_count', 'in_carts_count')
 
     def to_representation(self, instance: Recipe) -> OrderedDict:
         data = super().to_representation(instance)
@@ -1,8 +1,22 @@
+import json
 from collections import OrderedDict
+from typing import List
 
+from django.db import transaction
+from django.db.models import (Exists, F, OuterRef, Value,
+                              prefetch_related_objects)
+from django.db.models.query import QuerySet
+from recipes.catalog import RECIPES_CATALOG, bump_catalog_version
 from recipes.models import (MAX_OF_AMOUNT, MIN_OF_AMOUNT, AmountIngredient,
-                            Favorite, Recipe, ShoppingCart)
+                            Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.search import schedule_search_update
+from recipes.storage import recipe_image_storage
+from recipes.user_state import (FAVORITES, FOLLOWING, SHOPPING_CART,
+                                get_user_state)
+from users.models import Follow, User
 
+from .autocomplete import ingredient_autocomplete
 from .exceptions import IngredientError
 
 
@@ -11,24 +25,80 @@ class RecipeSerivce:
     def validate_recipe(self, data: OrderedDict) -> OrderedDict:
         """
         В data записываем ingredient-ы так как они сериализуются
-        только для чтения.
+        только для чтения. В multipart запросе ингредиенты приходят
+        json строкой.
+        Ошибки id, повторов и количества возвращаем все сразу.
         """
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = RecipeSerivce.parse_ingredients(self)
+        errors = {}
         ingredient_ids = [ingredient.get('id') for ingredient in ingredients]
+        try:
+            RecipeSerivce.validate_ingredient_ids(self, ingredient_ids)
+        except IngredientError as error:
+            errors.update(error.detail)
+
+        if len(ingredient_ids) != len(set(map(str, ingredient_ids))):
+            errors['ingredient'] = 'Ингредиент уже добавлен'
 
-        if len(ingredient_ids) != len(set(ingredient_ids)):
-            raise IngredientError({'ingredient': 'Ингредиент уже добавлен'})
-        
-        amounts = [ing.get('amount') for ing in ingredients
-                   if MIN_OF_AMOUNT <= int(ing.get('amount')) <= MAX_OF_AMOUNT]
-        
-        if len(amounts) != len(ingredients):
-            raise IngredientError(
-                {'amount': 'количество должно быть '
-                 f'больше {MIN_OF_AMOUNT} и меньше {MAX_OF_AMOUNT}'})
+        if not all(RecipeSerivce.is_valid_amount(self, ing.get('amount'))
+                   for ing in ingredients):
+            errors['amount'] = ('количество - целое число, больше '
+                                f'{MIN_OF_AMOUNT} и меньше {MAX_OF_AMOUNT}')
+        if errors:
+            raise IngredientError(errors)
         data['ingredients'] = ingredients
         return data
-    
+
+    def parse_ingredients(self) -> List[dict]:
+        """
+        Ингредиенты из запроса - список объектов с id и amount,
+        в multipart запросе - json строкой.
+        """
+        ingredients = self.initial_data.get('ingredients')
+        if isinstance(ingredients, str):
+            try:
+                ingredients = json.loads(ingredients)
+            except ValueError:
+                ingredients = None
+        if not isinstance(ingredients, list):
+            raise IngredientError({'ingredients': 'Передайте список '
+                                   'ингредиентов'})
+        if not all(isinstance(ingredient, dict)
+                   for ingredient in ingredients):
+            raise IngredientError({'ingredients': 'Ингредиент - объект '
+                                   'с полями id и amount'})
+        return ingredients
+
+    def is_valid_amount(self, amount) -> bool:
+        """Количество - целое число в пределах MIN_OF_AMOUNT..MAX_OF_AMOUNT."""
+        try:
+            amount = int(amount)
+        except (TypeError, ValueError):
+            return False
+        return MIN_OF_AMOUNT <= amount <= MAX_OF_AMOUNT
+
+    def validate_ingredient_ids(self, ids: List) -> None:
+        """
+        Проверяем, что все ингредиенты существуют, одной проверкой:
+        по индексу ингредиентов в памяти, если он уже построен, иначе
+        одним IN запросом. Ошибочные id возвращаем все сразу.
+        """
+        try:
+            ids = {int(id) for id in ids}
+        except (TypeError, ValueError):
+            raise IngredientError({'ingredients': 'id ингредиента - число'})
+
+        index = ingredient_autocomplete.get_built_index()
+        if index is not None:
+            existing = ids & index.ids
+        else:
+            existing = set(Ingredient.objects.filter(
+                id__in=ids).values_list('id', flat=True))
+        missing = ids - existing
+        if missing:
+            raise IngredientError({'ingredients': 'Ингредиенты не найдены: '
+                                   f'{sorted(missing)}'})
+
     def create_recipe(self, validated_data: dict) -> Recipe:
         """
         При создании рецепта:
@@ -37,53 +107,172 @@ class RecipeSerivce:
         - Добавляем к объекту recipe теги
         - Создаем в связанной таблице AmountIngredient записи об ингредиентах и
           их количестве.
+        Все в одной транзакции: текст для поиска считается после коммита,
+        когда теги и ингредиенты уже записаны.
         """
         tags = validated_data.pop('tags')
         ingredients_data = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-
-        AmountIngredient.objects.bulk_create(
-            [AmountIngredient(
-                recipe=recipe,
-                ingredient_id=ingredient_data.pop('id'),
-                amount=ingredient_data.pop('amount')
-            ) for ingredient_data in ingredients_data])
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            recipe.tags.set(tags)
+
+            AmountIngredient.objects.bulk_create(
+                [AmountIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_data.pop('id'),
+                    amount=ingredient_data.pop('amount')
+                ) for ingredient_data in ingredients_data])
+        prefetch_related_objects([recipe], 'amountingredient_set__ingredient')
         return recipe
     
     def update_recipe(self, instance: Recipe, validated_data: dict) -> Recipe:
         """
-        Если есть запись обновления поля, берем ее из validated_data иначе
-        берем уже имеющуюся запись.
-        Информацию об ингредиентах отчищаем и создаем по новой.
-        """
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get(
-            'text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
-        )
-
-        instance.tags.clear()
-        instance.tags.set(validated_data.get('tags'))
-
-        AmountIngredient.objects.filter(recipe=instance).all().delete()
-        AmountIngredient.objects.bulk_create(
-            [AmountIngredient(
-                recipe=instance,
-                ingredient_id=ingredient_data.pop('id'),
-                amount=ingredient_data.pop('amount')
-            ) for ingredient_data in validated_data.get('ingredients')])
-        instance.save()
+        Обновление рецепта в одной транзакции, пишем только изменения:
+        - Поля рецепта сохраняем через update_fields, только измененные
+        - Теги и ингредиенты сравниваем с текущими и добавляем, обновляем
+          и удаляем только отличающиеся строки
+        - Версию корзин с этим рецептом увеличиваем, только если
+          изменились ингредиенты
+        - Текст для поиска пересчитываем после коммита, если изменились
+          поля, теги или ингредиенты
+        """
+        with transaction.atomic():
+            changed_fields = RecipeSerivce.get_changed_fields(
+                self, instance, validated_data)
+            tags_changed = 'tags' in validated_data and (
+                RecipeSerivce.update_tags(
+                    self, instance, validated_data['tags']))
+            ingredients_changed = 'ingredients' in validated_data and (
+                RecipeSerivce.update_ingredients(
+                    self, instance, validated_data['ingredients']))
+
+            if ingredients_changed:
+                User.objects.filter(shoppingcart__recipe=instance).update(
+                    cart_version=F('cart_version') + 1)
+            if changed_fields:
+                instance.save(update_fields=changed_fields)
+            elif tags_changed or ingredients_changed:
+                transaction.on_commit(
+                    lambda: bump_catalog_version(RECIPES_CATALOG))
+                schedule_search_update(instance.id)
+        prefetch_related_objects(
+            [instance], 'amountingredient_set__ingredient')
         return instance
 
-    def get_favorite(self, obj: Recipe) -> Favorite:
-        return Favorite.objects.filter(
-            user_id=self.context.get('request').user.id,
-            recipe=obj).exists()
+    def get_changed_fields(self, instance: Recipe,
+                           validated_data: dict) -> List[str]:
+        """
+        Записываем в instance новые значения полей и возвращаем список
+        измененных. Картинку сравниваем по имени в хранилище - хешу
+        содержимого, повторно отправленная картинка не изменение.
+        """
+        changed = []
+        for field in ('name', 'text', 'cooking_time'):
+            if field in validated_data and (
+                    getattr(instance, field) != validated_data[field]):
+                setattr(instance, field, validated_data[field])
+                changed.append(field)
+
+        image = validated_data.get('image')
+        if image is not None:
+            image_field = Recipe._meta.get_field('image')
+            name = recipe_image_storage.get_content_name(
+                image_field.generate_filename(instance, image.name), image)
+            if name != instance.image.name:
+                instance.image = image
+                changed.append('image')
+        return changed
+
+    def update_tags(self, instance: Recipe, tags: List[Tag]) -> bool:
+        """Удаляем убранные и добавляем новые теги рецепта."""
+        current = set(RecipeTag.objects.filter(
+            recipe=instance).values_list('tag_id', flat=True))
+        requested = {tag.id for tag in tags}
+        if current == requested:
+            return False
+        RecipeTag.objects.filter(
+            recipe=instance, tag_id__in=current - requested).delete()
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe=instance, tag_id=tag_id)
+             for tag_id in requested - current])
+        return True
+
+    def update_ingredients(self, instance: Recipe,
+                           ingredients_data: List[dict]) -> bool:
+        """
+        Сравниваем ингредиенты рецепта с ingredients_data:
+        удаляем убранные, обновляем количество измененных через
+        bulk_update и создаем новые.
+        """
+        current = {
+            amount.ingredient_id: amount
+            for amount in AmountIngredient.objects.filter(recipe=instance)}
+        requested = {
+            int(ingredient_data['id']): int(ingredient_data['amount'])
+            for ingredient_data in ingredients_data}
+
+        removed = set(current) - set(requested)
+        changed = []
+        for ingredient_id, amount in requested.items():
+            if ingredient_id in current and (
+                    current[ingredient_id].amount != amount):
+                current[ingredient_id].amount = amount
+                changed.append(current[ingredient_id])
+        created = [
+            AmountIngredient(recipe=instance, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in requested.items()
+            if ingredient_id not in current]
+
+        if removed:
+            AmountIngredient.objects.filter(
+                recipe=instance, ingredient_id__in=removed).delete()
+        if changed:
+            AmountIngredient.objects.bulk_update(changed, ('amount',))
+        if created:
+            AmountIngredient.objects.bulk_create(created)
+        return bool(removed or changed or created)
 
-    def get_shopping_cart(self, obj: Recipe) -> ShoppingCart:
-        return ShoppingCart.objects.filter(
-            user_id=self.context.get('request').user.id,
-            recipe=obj).exists()
+    def get_recipes(self, shared: bool = False) -> QuerySet:
+        """
+        Queryset рецептов для GET запросов:
+        - Автор подтягивается через JOIN, теги и ингредиенты одним
+          prefetch-запросом на каждую связь.
+        - Флаги is_favorited, is_in_shopping_cart и author_is_subscribed
+          вычисляются в том же запросе через EXISTS подзапросы, для
+          анонимного пользователя и общего для всех ответа (shared) -
+          константа False.
+        """
+        user = self.request.user
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'amountingredient_set__ingredient')
+
+        if user.is_anonymous or shared:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False))
+
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author'))))
+
+    def apply_user_state(self, data: dict, user: User) -> dict:
+        """
+        Флаги пользователя в общем для всех ответе со списком или одним
+        рецептом: is_favorited, is_in_shopping_cart и
+        author.is_subscribed берем из множеств id get_user_state.
+        """
+        state = get_user_state(user.id)
+        recipes = data['results'] if 'results' in data else [data]
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in state[FAVORITES]
+            recipe['is_in_shopping_cart'] = (
+                recipe['id'] in state[SHOPPING_CART])
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in state[FOLLOWING])
+        return data
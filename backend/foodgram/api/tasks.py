@@ -0,0 +1,34 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from recipes.storage import private_storage
+
+from foodgram.celery import app
+
+from .pdf import render_shopping_cart
+from .utils import (SHOPPING_CART_DIR, get_cart_ingredients,
+                    get_shopping_cart_path)
+
+
+@app.task
+def build_shopping_cart(user_id: int, version: int) -> str:
+    """
+    Формирование pdf файла корзины пользователя для версии корзины.
+        - Если файл этой версии уже есть в хранилище, повторно не рендерим
+        - Удаляем только файлы более старых версий корзины: задача,
+          запоздавшая со старой версией, не удалит файл новой
+    """
+    path = get_shopping_cart_path(user_id, version)
+    if not private_storage.exists(path):
+        output = BytesIO()
+        render_shopping_cart(get_cart_ingredients(user_id), output)
+        private_storage.save(path, ContentFile(output.getvalue()))
+
+    user_dir = os.path.join(SHOPPING_CART_DIR, str(user_id))
+    _, files = private_storage.listdir(user_dir)
+    for name in files:
+        stem, _ = os.path.splitext(name)
+        if stem.isdigit() and int(stem) < version:
+            private_storage.delete(os.path.join(user_dir, name))
+    return path
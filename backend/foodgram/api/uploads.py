@@ -0,0 +1,61 @@
+from base64 import b64decode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+# Кратно 4, чтобы каждая часть base64 строки декодировалась отдельно
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def get_decoded_size(data: str) -> int:
+    """Размер данных base64 строки без ее декодирования."""
+    return len(data) * 3 // 4 - data[-2:].count('=')
+
+
+class Base64UploadedFile(TemporaryUploadedFile):
+    """
+    Временный файл декодированной base64 картинки.
+    Файлы multipart запроса закрывает Django в конце запроса, этот файл
+    закрываем при удалении объекта: хранилище могло уже переместить его.
+    """
+    def __del__(self):
+        self.close()
+
+
+def decode_base64_file(data: str, name: str,
+                       content_type: str) -> Base64UploadedFile:
+    """
+    Декодируем base64 строку частями во временный файл на диске:
+    в памяти не держим одновременно строку и все декодированные байты,
+    картинку Pillow проверяет по пути к файлу, хранилище файл перемещает.
+    """
+    file = Base64UploadedFile(name, content_type, 0, None)
+    try:
+        for start in range(0, len(data), BASE64_CHUNK_SIZE):
+            file.write(b64decode(data[start:start + BASE64_CHUNK_SIZE]))
+    except BinasciiError:
+        file.close()
+        raise
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+class MaxImageSizeUploadHandler(FileUploadHandler):
+    """
+    Ограничение размера загружаемого multipart файла.
+    Считает пришедшие части файла и прерывает разбор запроса, как только
+    размер превысил MAX_IMAGE_SIZE, части передаются дальше по цепочке
+    FILE_UPLOAD_HANDLERS.
+    """
+    def receive_data_chunk(self, raw_data: bytes, start: int) -> bytes:
+        if start + len(raw_data) > settings.MAX_IMAGE_SIZE:
+            raise MultiPartParserError(
+                f'Размер картинки больше {settings.MAX_IMAGE_SIZE} байт.')
+        return raw_data
+
+    def file_complete(self, file_size: int) -> None:
+        return None
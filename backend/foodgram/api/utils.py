@@ -1,54 +1,110 @@
+import csv
+import json
 import os
+from typing import Iterable, Iterator
 
+from django.db.models import F, Sum
 from django.db.models.query import QuerySet
-from django.http import HttpResponse
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen.canvas import Canvas
+from django.http import FileResponse, StreamingHttpResponse
+from recipes.models import AmountIngredient
+from recipes.storage import private_storage
+from rest_framework.renderers import BaseRenderer
 
+SHOPPING_CART_DIR = 'shopping_carts'
+SHOPPING_CART_FILENAME = 'recipe.pdf'
+SHOPPING_CART_TASK_TIMEOUT = 10 * 60
+STREAM_CHUNK_SIZE = 2000
 
-def get_shopping_cart(queryset: QuerySet) -> HttpResponse:
+
+def get_cart_ingredients(user_id: int) -> QuerySet:
+    """
+    Список продуктов из корзины пользователя одним запросом:
+        - Берем AmountIngredient рецептов из ShoppingCart пользователя
+        - Группируем по ингредиенту и ед. измерения, суммируем количество
+        - Сортируем по названию ингредиента
+    """
+    return AmountIngredient.objects.filter(
+        recipe__shoppingcart__user_id=user_id,
+    ).values(
+        'ingredient_id',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).annotate(
+        total_amount=Sum('amount'),
+    ).order_by('name')
+
+
+def get_shopping_cart_path(user_id: int, version: int) -> str:
+    """Путь к pdf файлу корзины в закрытом хранилище для версии корзины."""
+    return os.path.join(SHOPPING_CART_DIR, str(user_id), f'{version}.pdf')
+
+
+def get_shopping_cart_task_key(user_id: int, version: int) -> str:
+    """Ключ кеша с id задачи формирования pdf для версии корзины."""
+    return f'shopping_cart_task:{user_id}:{version}'
+
+
+def get_shopping_cart_response(path: str) -> FileResponse:
+    """Отдаем готовый pdf файл корзины из хранилища."""
+    return FileResponse(
+        private_storage.open(path),
+        as_attachment=True,
+        filename=SHOPPING_CART_FILENAME,
+        content_type='application/pdf')
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_txt(ingredients: Iterable[dict]) -> Iterator[str]:
+    for obj in ingredients:
+        yield (f'{obj["name"]} - '
+               f'{obj["total_amount"]} {obj["measurement_unit"]}\n')
+
+
+def iter_csv(ingredients: Iterable[dict]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for obj in ingredients:
+        yield writer.writerow(
+            (obj['name'], obj['total_amount'], obj['measurement_unit']))
+
+
+def iter_json(ingredients: Iterable[dict]) -> Iterator[str]:
+    separator = '['
+    for obj in ingredients:
+        yield separator + json.dumps(
+            {'id': obj['ingredient_id'],
+             'name': obj['name'],
+             'measurement_unit': obj['measurement_unit'],
+             'amount': obj['total_amount']},
+            ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_CART_EXPORTS = {
+    'txt': iter_txt,
+    'csv': iter_csv,
+    'json': iter_json,
+}
+
+
+def get_shopping_cart_stream(
+        ingredients: QuerySet,
+        renderer: BaseRenderer) -> StreamingHttpResponse:
     """
-    Функция для создания pdf файла ингредиентов для покупки.
-        - Создаем список data со всеми ингредиентами.
-        - Затем создаем pdf file используя Canvas
-        - В словаре result_cart объединяем одинаковые ингредиенты
-        - Записываем их в pdf file
+    Отдаем список покупок в текстовом формате потоком:
+        - Строки читаются из курсора БД через iterator() пачками
+        - Формат и Content-Type берем из выбранного рендерера
     """
-    data = [queryset[i].recipe.ingredients.all().values(
-            'name', 'measurement_unit', 'amountingredient__amount')
-            for i, _ in enumerate(queryset)]
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="recipe.pdf"'
-
-    file = Canvas(response)
-
-    path_to_font = os.path.join('static/download_cart', 'arial.ttf')
-    pdfmetrics.registerFont(TTFont('Arial', path_to_font))
-    file.setFont('Arial', 18)
-
-    path_to_image = os.path.join('static/download_cart', 'download.jpg')
-    file.drawImage(path_to_image, 0, -400)
-
-    file.drawString(50, 780, 'Наименование')
-    file.drawString(400, 780, 'Количество')
-
-    result_cart = {}
-    for element in data:
-        for ingredient in element:
-            if ingredient['name'] in result_cart:
-                result_cart[ingredient['name']]['amountingredient__amount'] +=(
-                    ingredient['amountingredient__amount'])
-            else:
-                result_cart[ingredient['name']] = ingredient
-
-    for i, obj in enumerate(result_cart.values()):
-        file.drawString(50, 750 - i * 20, obj['name'])
-        file.drawString(
-            400, 750 - i * 20,
-            f'{obj["amountingredient__amount"]} {obj["measurement_unit"]}')
-
-    file.showPage()
-    file.save()
+    export = SHOPPING_CART_EXPORTS[renderer.format]
+    response = StreamingHttpResponse(
+        export(ingredients.iterator(chunk_size=STREAM_CHUNK_SIZE)),
+        content_type=f'{renderer.media_type}; charset=utf-8')
+    response['Content-Disposition'] = (
+        f'attachment; filename="recipe.{renderer.format}"')
     return response
@@ -1,40 +1,67 @@
+from functools import partial
+from uuid import uuid4
+
+from celery.result import AsyncResult
+from django.core.cache import cache
+from django.db.models.query import QuerySet
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes.catalog import (AUTHORS_CATALOG, INGREDIENTS_CATALOG,
+                             RECIPES_CATALOG, TAGS_CATALOG)
+from recipes.feed import get_feed_ids
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.rankings import get_trending
+from recipes.storage import private_storage
 from rest_framework.decorators import action
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin, RetrieveModelMixin,
                                    UpdateModelMixin)
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
-                                   HTTP_405_METHOD_NOT_ALLOWED)
+from rest_framework.status import (HTTP_201_CREATED, HTTP_202_ACCEPTED,
+                                   HTTP_204_NO_CONTENT, HTTP_404_NOT_FOUND,
+                                   HTTP_405_METHOD_NOT_ALLOWED,
+                                   HTTP_500_INTERNAL_SERVER_ERROR)
 from rest_framework.viewsets import GenericViewSet
-from users.models import User
 
-from foodgram.pagination import PagePaginationWithLimit
+from foodgram.celery import app as celery_app
+from foodgram.pagination import (FeedPagination, PagePaginationWithLimit,
+                                 RecipePagination)
 
+from .autocomplete import AUTOCOMPLETE_LIMIT, ingredient_autocomplete
 from .exceptions import CantAddTwice
 from .filters import IngredientFilter, RecipeFilter
+from .mixins import CatalogListMixin, ResponseCacheMixin, StreamingListMixin
 from .permissions import IsAuthorAndAuthenticatedOrReadOnly
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from .serializers import (IngredientInfoSerializer, RecipeCreateSerializer,
                           RecipeSerializer, RecipeShortSerializer,
                           TagSerializer)
-from .utils import get_shopping_cart
+from .services import RecipeSerivce
+from .tasks import build_shopping_cart
+from .utils import (SHOPPING_CART_TASK_TIMEOUT, get_cart_ingredients,
+                    get_shopping_cart_path, get_shopping_cart_response,
+                    get_shopping_cart_stream, get_shopping_cart_task_key)
 
 
-class TagViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet,):
+class TagViewSet(CatalogListMixin, ListModelMixin, RetrieveModelMixin,
+                 GenericViewSet,):
 
+    catalog = TAGS_CATALOG
     pagination_class = None
     http_method_names = ('get',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet,):
+class IngredientViewSet(CatalogListMixin, ListModelMixin, RetrieveModelMixin,
+                        GenericViewSet,):
 
+    catalog = INGREDIENTS_CATALOG
     pagination_class = None
     http_method_names = ('get',)
     queryset = Ingredient.objects.all()
@@ -42,13 +69,29 @@ class IngredientViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet,):
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def list(self, request: Request) -> Response:
+        """
+        Автодополнение по ?name= отвечает из индекса ингредиентов в памяти,
+        без запросов к БД. Количество результатов - ?limit=.
+        Полный список отдается через CatalogListMixin.
+        """
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request)
+        limit = request.query_params.get('limit', '')
+        return Response(ingredient_autocomplete.search(
+            name,
+            int(limit) if limit.isdigit() else AUTOCOMPLETE_LIMIT))
 
-class RecipeViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin,
-                    DestroyModelMixin, UpdateModelMixin, GenericViewSet):
 
-    queryset = Recipe.objects.prefetch_related(
-        'ingredients__amountingredient_set').all()
-    pagination_class = PagePaginationWithLimit
+class RecipeViewSet(ResponseCacheMixin, StreamingListMixin, ListModelMixin,
+                    RetrieveModelMixin, CreateModelMixin, DestroyModelMixin,
+                    UpdateModelMixin, GenericViewSet):
+
+    response_cache_catalogs = (RECIPES_CATALOG, TAGS_CATALOG,
+                               INGREDIENTS_CATALOG, AUTHORS_CATALOG)
+    response_cache_user_params = ('is_favorited', 'is_in_shopping_cart')
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ('get', 'post', 'patch', 'delete')
@@ -60,17 +103,126 @@ class RecipeViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin,
         filter_backends=None,
         pagination_class=None,
         url_path='download_shopping_cart',
-        permission_classes=(IsAuthenticated,),)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PDFRenderer, PlainTextRenderer, CSVRenderer,
+                          JSONRenderer),)
     def download_shopping_cart(self, request: Request) -> HttpResponse:
         """
-        Выдаем рецепт в виде pdf-file-a:
-        - Создаем queryset Рецептов занесенных пользователем в корзину
-        - Пердаем queryset в функцию формирования файла get_shopping_cart
+        Выдаем список покупок в формате из ?format=txt|csv|json|pdf
+        или заголовка Accept, по умолчанию pdf:
+        - txt, csv и json отдаем потоком из БД, без формирования pdf
+        - Если pdf для текущей версии корзины уже сформирован, отдаем его
+        - Иначе ставим задачу build_shopping_cart в celery и отвечаем 202
+          со ссылкой на статус задачи (без брокера задача выполняется
+          сразу и файл отдается в этом же запросе)
+        - Задача ставится одна на версию корзины: id задачи занимаем
+          в кеше через cache.add, повторные запросы получают ту же ссылку
         """
-        user = get_object_or_404(User, id=request.user.id)
-        queryset = ShoppingCart.objects.select_related(
-            'recipe').filter(user=user)
-        return get_shopping_cart(queryset)
+        user = request.user
+        if request.accepted_renderer.format != PDFRenderer.format:
+            return get_shopping_cart_stream(
+                get_cart_ingredients(user.id), request.accepted_renderer)
+
+        path = get_shopping_cart_path(user.id, user.cart_version)
+        if private_storage.exists(path):
+            return get_shopping_cart_response(path)
+
+        key = get_shopping_cart_task_key(user.id, user.cart_version)
+        task_id = str(uuid4())
+        if cache.add(key, task_id, SHOPPING_CART_TASK_TIMEOUT):
+            task = build_shopping_cart.apply_async(
+                (user.id, user.cart_version), task_id=task_id)
+            if private_storage.exists(path):
+                return get_shopping_cart_response(path)
+            if task.failed():
+                cache.delete(key)
+                return Response(
+                    {'status': task.status}, HTTP_500_INTERNAL_SERVER_ERROR)
+        else:
+            task_id = cache.get(key, task_id)
+
+        status_url = reverse(
+            'recipes-shopping-cart-status', kwargs={'task_id': task_id})
+        return Response({'status_url': status_url}, HTTP_202_ACCEPTED,
+                        content_type='application/json')
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        filter_backends=None,
+        pagination_class=None,
+        url_path=r'download_shopping_cart/(?P<task_id>[\w-]+)',
+        url_name='shopping-cart-status',
+        permission_classes=(IsAuthenticated,),)
+    def shopping_cart_status(
+            self,
+            request: Request, task_id: str) -> HttpResponse:
+        """
+        Статус формирования pdf-file-a:
+        - Если pdf для текущей версии корзины готов, отдаем его
+        - Пока задача выполняется - 202, при ошибке задачи - 500
+          (ключ задачи снимаем, следующий запрос поставит новую)
+        - Если корзина изменилась после постановки задачи или задача
+          неизвестна - 404, файл нужно запросить заново
+        """
+        user = request.user
+        path = get_shopping_cart_path(user.id, user.cart_version)
+        if private_storage.exists(path):
+            return get_shopping_cart_response(path)
+
+        key = get_shopping_cart_task_key(user.id, user.cart_version)
+        if cache.get(key) == task_id:
+            task = AsyncResult(task_id, app=celery_app)
+            if not task.ready():
+                return Response({'status': task.status}, HTTP_202_ACCEPTED)
+            if task.failed():
+                cache.delete(key)
+                return Response(
+                    {'status': task.status}, HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(
+            {'errors': 'Корзина изменилась, запросите файл заново'},
+            HTTP_404_NOT_FOUND)
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        filter_backends=None,
+        pagination_class=FeedPagination,
+        url_path='feed',
+        permission_classes=(IsAuthenticated,),)
+    def feed(self, request: Request) -> Response:
+        """
+        Лента рецептов авторов, на которых подписан пользователь:
+        - Новые первыми, пагинация курсором ?cursor=&limit=
+        - id страницы берем из ленты в кеше (см. recipes.feed), рецепты
+          страницы - одним запросом по id
+        - права доступа: авторизованные пользователи
+        """
+        ids = self.paginator.paginate_ids(
+            request, partial(get_feed_ids, request.user.id))
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=('GET',),
+        detail=False,
+        pagination_class=PagePaginationWithLimit,
+        url_path='trending',)
+    def trending(self, request: Request) -> Response:
+        """
+        Рецепты, которые чаще всего добавляли в избранное и корзины за
+        последнее время (TRENDING_WINDOW):
+        - Порядок из таблицы RecipeRanking, которую пересчитывает
+          celery beat, поддерживаются фильтры списка рецептов
+        - права доступа: все пользователи
+        """
+        page = self.paginate_queryset(
+            get_trending(self.filter_queryset(self.get_queryset())))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=('POST', 'DELETE'),
@@ -95,6 +247,8 @@ class RecipeViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin,
             if not created:
                 raise CantAddTwice({'errors': 'Нельзя добавлять повторно'})
 
+            recipe.refresh_from_db(
+                fields=('favorites_count', 'in_carts_count'))
             serializer = RecipeShortSerializer(
                 recipe, context={'request': request})
             return Response(serializer.data, HTTP_201_CREATED)
@@ -129,6 +283,8 @@ class RecipeViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin,
             if not created:
                 raise CantAddTwice({'errors': 'Нельзя добавлять повторно'})
             
+            recipe.refresh_from_db(
+                fields=('favorites_count', 'in_carts_count'))
             serializer = RecipeShortSerializer(
                 recipe, context={'request': request})
             return Response(serializer.data, HTTP_201_CREATED)
@@ -140,10 +296,17 @@ class RecipeViewSet(ListModelMixin, RetrieveModelMixin, CreateModelMixin,
 
         return Response(status=HTTP_405_METHOD_NOT_ALLOWED)
 
+    def get_queryset(self) -> QuerySet:
+        return RecipeSerivce.get_recipes(self, self.response_cache_shared)
+
+    def apply_user_state(self, data: dict, request: Request) -> dict:
+        return RecipeSerivce.apply_user_state(self, data, request.user)
+
     def get_serializer_class(self) -> None:
-        if self.action in ('favorite', 'download_shopping_cart'):
+        if self.action in ('favorite', 'download_shopping_cart',
+                           'shopping_cart_status'):
             return None
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed', 'trending'):
             return RecipeSerializer
         if self.action in ('create', 'partial_update'):
             return RecipeCreateSerializer
@@ -18,5 +18,9 @@ app.conf.beat_schedule = {
         'task': 'users.tasks.delete_expired_tokens',
         'schedule': crontab(minute=0, hour=0),
     },
+    'refresh-recipe-rankings': {
+        'task': 'recipes.tasks.refresh_recipe_rankings',
+        'schedule': crontab(minute='*/10'),
+    },
 }
 app.conf.timezone = 'UTC'
@@ -0,0 +1,24 @@
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete
+
+
+def get_delta(signal, **kwargs) -> int:
+    """
+    Изменение счетчика: +1 при создании записи, -1 при удалении,
+    0 при обновлении существующей записи и при loaddata (raw) - такие
+    данные сверяет команда reconcile_counters.
+    """
+    if signal is post_delete:
+        return -1
+    return 1 if kwargs.get('created') and not kwargs.get('raw') else 0
+
+
+def shift_counter(queryset: QuerySet, counter: str, delta: int) -> int:
+    """
+    Изменение счетчика counter записей queryset на delta одним UPDATE.
+    Счетчик не уходит ниже нуля, даже если разошелся с данными.
+    """
+    return queryset.update(
+        **{counter: Greatest(F(counter) + delta, Value(0))})
@@ -1,6 +1,306 @@
+import hashlib
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import (EmptyPage, InvalidPage, Page,
+                                   PageNotAnInteger)
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from recipes.catalog import RECIPES_CATALOG, get_catalog_version
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def get_estimated_count(queryset: QuerySet) -> Optional[int]:
+    """
+    Оценка количества строк таблицы по статистике Postgres (reltuples).
+    Для других БД и таблиц без статистики - None.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPage(Page):
+    """Страница при оценочном количестве: есть ли следующая - по данным."""
+    def has_next(self) -> bool:
+        return self.next_exists
+
+
+class CountPaginator(DjangoPaginator):
+    """
+    Paginator, количество объектов которого считает get_count.
+    Если количество оценочное (is_count_exact() ложно), номер страницы
+    сверху не ограничивается, а страница не обрезается по количеству:
+    оценка может быть меньше реального числа объектов.
+    """
+    def __init__(self, object_list, per_page, get_count: Callable,
+                 is_count_exact: Callable = lambda: True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = get_count
+        self.is_count_exact = is_count_exact
+
+    @cached_property
+    def count(self) -> int:
+        return self.get_count(self.object_list)
+
+    def count_is_estimated(self) -> bool:
+        # Точность количества известна только после его подсчета
+        self.count
+        return not self.is_count_exact()
+
+    def validate_number(self, number) -> int:
+        if not self.count_is_estimated():
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number) -> Page:
+        if not self.count_is_estimated():
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        page = EstimatedCountPage(self.object_list[bottom:top], number, self)
+        page.next_exists = self.object_list[top:top + 1].exists()
+        return page
 
 
 class PagePaginationWithLimit(PageNumberPagination):
-    """Доп. параметр для пагинации."""
+    """
+    Доп. параметр для пагинации.
+    Кроме ?page= поддерживает режим курсора ?cursor=: страница выбирается
+    по id последнего объекта прошлой страницы (WHERE id < cursor) без
+    COUNT(*) и OFFSET. Пустой ?cursor= - первая страница.
+    ?limit= ограничен max_page_size, страницы больше stream_page_size
+    можно отдать потоком через get_streaming_response.
+    """
     page_size_query_param = ('limit')
+    max_page_size = settings.MAX_PAGE_SIZE
+    stream_page_size = settings.STREAM_PAGE_SIZE
+    stream_chunk_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    cursor_ordering_message = ('Курсор поддерживается только для сортировки '
+                               'по id, используйте ?page=.')
+    cursor_orderings = ('id', '-id', 'pk', '-pk')
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request,
+                          view=None) -> Optional[List]:
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            self.count_exact = True
+            self.django_paginator_class = partial(
+                CountPaginator, get_count=partial(self.get_count, request),
+                is_count_exact=lambda: self.count_exact)
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+
+        ordering = self.get_cursor_ordering(queryset)
+        cursor = self.get_cursor(request)
+        if cursor is not None:
+            lookup = 'id__lt' if ordering == '-id' else 'id__gt'
+            queryset = queryset.filter(**{lookup: cursor})
+
+        page = list(queryset.order_by(ordering)[:page_size + 1])
+        self.next_cursor = page[page_size - 1].id if len(
+            page) > page_size else None
+        return page[:page_size]
+
+    def is_streamed(self, request: Request) -> bool:
+        """Страницу ?page= больше stream_page_size отдаем потоком."""
+        return (self.cursor_query_param not in request.query_params
+                and (self.get_page_size(request) or 0) > self.stream_page_size)
+
+    def paginate_queryset_lazy(self, queryset: QuerySet,
+                               request: Request) -> QuerySet:
+        """
+        Как paginate_queryset для ?page=, но страница остается ленивым
+        QuerySet и не загружается в память целиком.
+        """
+        self.cursor_mode = False
+        self.count_exact = True
+        self.request = request
+        paginator = CountPaginator(
+            queryset, self.get_page_size(request),
+            get_count=partial(self.get_count, request),
+            is_count_exact=lambda: self.count_exact)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        return self.page.object_list
+
+    def iter_streaming_content(self, objects: QuerySet,
+                               serialize: Callable) -> Iterator[bytes]:
+        """
+        Json страницы по частям: сначала count, next и previous, затем
+        results - по stream_chunk_size объектов из objects.iterator().
+        """
+        renderer = JSONRenderer()
+        head = renderer.render(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ]))
+        yield head[:-1] + b',"results":['
+
+        iterator = objects.iterator(chunk_size=self.stream_chunk_size)
+        separator = b''
+        while True:
+            chunk = list(islice(iterator, self.stream_chunk_size))
+            if not chunk:
+                break
+            yield separator + renderer.render(serialize(chunk))[1:-1]
+            separator = b','
+        yield b']}'
+
+    def get_streaming_response(self, objects: QuerySet,
+                               serialize: Callable) -> StreamingHttpResponse:
+        return StreamingHttpResponse(
+            self.iter_streaming_content(objects, serialize),
+            content_type='application/json')
+
+    def get_count(self, request: Request, queryset: QuerySet) -> int:
+        """Количество объектов страницы, по умолчанию точный COUNT(*)."""
+        return queryset.count()
+
+    def get_cursor_ordering(self, queryset: QuerySet) -> str:
+        """
+        Направление обхода по id - как у сортировки queryset.
+        Другую сортировку (релевантность, популярность) курсор по id
+        не сохранит, такой запрос отклоняем.
+        """
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if any(not isinstance(field, str) or field not in (
+                self.cursor_orderings) for field in ordering):
+            raise ValidationError({
+                self.cursor_query_param: self.cursor_ordering_message})
+        if ordering and ordering[0].startswith('-'):
+            return '-id'
+        return 'id'
+
+    def get_cursor(self, request: Request) -> Optional[int]:
+        cursor = request.query_params[self.cursor_query_param]
+        if not cursor:
+            return None
+        if not cursor.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return int(cursor)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data: List) -> Response:
+        if not self.cursor_mode:
+            return Response(OrderedDict([
+                ('count', self.page.paginator.count),
+                ('count_exact', self.count_exact),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(PagePaginationWithLimit):
+    """
+    Пагинация списка рецептов с дешевым количеством:
+        - Без фильтров и при больших таблицах берем оценку reltuples
+          из статистики Postgres, count_exact = False
+        - Иначе COUNT(*) кешируем на count_cache_timeout секунд по набору
+          фильтров и версии списка рецептов, версия меняется при
+          создании, изменении и удалении рецепта
+        - Фильтры, зависящие от пользователя, не кешируем
+    """
+    count_cache_timeout = 60
+    count_estimate_threshold = 100_000
+    count_ignored_params = ('page', 'limit', 'cursor', 'format', 'ordering')
+    count_uncached_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_count_filters(self, request: Request) -> List[Tuple]:
+        """Нормализованный набор фильтров: без пагинации, отсортированный."""
+        return sorted(
+            (key, tuple(sorted(request.query_params.getlist(key))))
+            for key in request.query_params
+            if key not in self.count_ignored_params)
+
+    def get_count_cache_key(self, queryset: QuerySet,
+                            filters: List[Tuple]) -> str:
+        digest = hashlib.md5(repr(filters).encode()).hexdigest()
+        return (f'count:{queryset.model._meta.db_table}:'
+                f'{get_catalog_version(RECIPES_CATALOG)}:{digest}')
+
+    def get_count(self, request: Request, queryset: QuerySet) -> int:
+        filters = self.get_count_filters(request)
+        if not filters:
+            estimate = get_estimated_count(queryset)
+            if estimate is not None and (
+                    estimate >= self.count_estimate_threshold):
+                self.count_exact = False
+                return estimate
+
+        if any(key in self.count_uncached_params for key, _ in filters):
+            return queryset.count()
+        return cache.get_or_set(
+            self.get_count_cache_key(queryset, filters),
+            queryset.count, self.count_cache_timeout)
+
+
+class FeedPagination(PagePaginationWithLimit):
+    """
+    Пагинация ленты: всегда курсором ?cursor=, id страницы выбирает
+    get_ids(cursor, limit) без запроса к таблице рецептов.
+    """
+    def paginate_ids(self, request: Request,
+                     get_ids: Callable) -> List[int]:
+        self.cursor_mode = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = (self.get_cursor(request)
+                  if self.cursor_query_param in request.query_params
+                  else None)
+        ids = get_ids(cursor, page_size + 1)
+        self.next_cursor = ids[page_size - 1] if len(
+            ids) > page_size else None
+        return ids[:page_size]
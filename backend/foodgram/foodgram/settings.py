@@ -2,6 +2,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -127,12 +128,47 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 5,
 }
 
+# Кеш: redis из CACHE_LOCATION (redis://redis:6379/1), без него - память
+# процесса
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_LOCATION,
+    } if CACHE_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# Время жизни закешированных ответов api для анонимных пользователей
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 5 * 60))
+
+# Максимальный ?limit= и размер страницы, начиная с которого она отдается
+# потоком
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+STREAM_PAGE_SIZE = int(os.getenv('STREAM_PAGE_SIZE', 100))
+
+# Лента рецептов подписок: длина хранимой ленты, время жизни в кеше и
+# количество подписок, начиная с которого лента не хранится
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', 500))
+FEED_TIMEOUT = int(os.getenv('FEED_TIMEOUT', 24 * 60 * 60))
+FEED_MAX_FOLLOWING = int(os.getenv('FEED_MAX_FOLLOWING', 1000))
+
+# Окно в секундах, за которое считаются добавления для трендовых рецептов
+TRENDING_WINDOW = int(os.getenv('TRENDING_WINDOW', 3 * 24 * 60 * 60))
+
 # Celery
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 CELERY_TASK_TRACK_STARTED = bool(os.getenv('CELERY_TASK_TRACK_STARTED', True))
 CELERY_TASK_TIME_LIMIT = int(os.getenv('CELERY_TASK_TIME_LIMIT', 1))
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+
+# Версии кеша, ленты и блокировки общие для web и celery процессов:
+# кеш в памяти процесса с брокером их разводит
+if CELERY_BROKER_URL and not CACHE_LOCATION:
+    raise ImproperlyConfigured(
+        'С CELERY_BROKER_URL нужен общий кеш: задайте CACHE_LOCATION.')
 
 # JWT
 
@@ -201,6 +237,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Файлы пользователей, которые nginx не раздает (pdf корзины),
+# отдаются только через api
+PRIVATE_MEDIA_ROOT = os.getenv(
+    'PRIVATE_MEDIA_ROOT', os.path.join(BASE_DIR, 'private_media'))
+
+# Картинки из multipart запросов пишутся частями во временный файл,
+# размер проверяется до окончания загрузки
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', 10 * 1024 * 1024))
+FILE_UPLOAD_HANDLERS = [
+    'api.uploads.MaxImageSizeUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
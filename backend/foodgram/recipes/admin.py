@@ -37,14 +37,12 @@ class IngredientAdmin(ModelAdmin):
 @register(Recipe)
 class RecipeAdmin(ModelAdmin):
     inlines = (TagInline, IngredientInline,)
-    list_display = ('name', 'favorite_count')
+    list_display = ('name', 'favorites_count', 'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     search_fields = ('name',)
     list_filter = ('name',)
     empty_value_display = '-пусто-'
 
-    def favorite_count(self, obj):
-        return obj.favorites.count()
-
 
 @register(AmountIngredient)
 class AmountIngredientAdmin(ModelAdmin):
@@ -0,0 +1,41 @@
+import time
+from typing import Iterable, List
+
+from django.core.cache import cache
+
+INGREDIENTS_CATALOG = 'ingredients'
+TAGS_CATALOG = 'tags'
+RECIPES_CATALOG = 'recipes'
+AUTHORS_CATALOG = 'authors'
+
+
+def get_catalog_version_key(catalog: str) -> str:
+    return f'catalog_version:{catalog}'
+
+
+def get_catalog_version(catalog: str) -> int:
+    """
+    Версия справочника - время последнего изменения в наносекундах.
+    Если ключа в кеше нет, записываем текущее время: все процессы
+    увидят новую версию и перестроят свои данные.
+    """
+    return cache.get_or_set(
+        get_catalog_version_key(catalog), time.time_ns, timeout=None)
+
+
+def get_catalog_versions(catalogs: Iterable[str]) -> List[int]:
+    """Версии нескольких справочников одним чтением из кеша."""
+    keys = [get_catalog_version_key(catalog) for catalog in catalogs]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_catalog_version(catalog: str) -> int:
+    """Новая версия справочника после его изменения."""
+    version = time.time_ns()
+    cache.set(get_catalog_version_key(catalog), version, timeout=None)
+    return version
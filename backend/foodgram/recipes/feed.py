@@ -0,0 +1,142 @@
+import time
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from users.models import Follow
+
+from .models import Recipe
+
+FEED_PULL = 'pull'
+FEED_LOCK_TIMEOUT = 5
+FEED_LOCK_RETRY = 0.01
+
+
+def get_timeline_key(user_id: int) -> str:
+    return f'feed:{user_id}'
+
+
+@contextmanager
+def timeline_lock(user_id: int, wait: float) -> Iterator[bool]:
+    """
+    Блокировка ленты пользователя через cache.add (атомарен в redis и
+    locmem). Сборка, fan-out и сброс ленты выполняются под ней, чтобы
+    не терять вставки при конкурентном чтении-изменении-записи.
+    Ждем не дольше wait секунд, отдаем, получена ли блокировка.
+    В ключе лежит уникальный токен: если блокировка истекла и ее взял
+    другой процесс, при выходе мы ее не снимаем.
+    """
+    key = f'{get_timeline_key(user_id)}:lock'
+    token = uuid4().hex
+    deadline = time.monotonic() + wait
+    locked = cache.add(key, token, FEED_LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(FEED_LOCK_RETRY)
+        locked = cache.add(key, token, FEED_LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked and cache.get(key) == token:
+            cache.delete(key)
+
+
+def get_followed_recipe_ids(user_id: int, cursor: Optional[int],
+                            limit: int) -> List[int]:
+    """
+    id рецептов авторов, на которых подписан пользователь, новые первыми:
+    один запрос author_id IN (подзапрос подписок) по индексу (author, id).
+    """
+    queryset = Recipe.objects.filter(author_id__in=Follow.objects.filter(
+        user_id=user_id).values('following_id'))
+    if cursor is not None:
+        queryset = queryset.filter(id__lt=cursor)
+    return list(queryset.order_by('-id').values_list('id', flat=True)[:limit])
+
+
+def get_timeline(user_id: int):
+    """
+    Лента пользователя из кеша: список id рецептов, новые первыми, не
+    длиннее FEED_LENGTH. Если ленты нет, собираем ее одним запросом.
+    Подписанным больше чем на FEED_MAX_FOLLOWING авторов лента не
+    хранится - в кеше метка FEED_PULL, рецепты выбираются запросом.
+    Ленту собираем под блокировкой без ожидания: если ее держит fan-out,
+    собранная лента отдается без записи в кеш.
+    """
+    key = get_timeline_key(user_id)
+    timeline = cache.get(key)
+    if timeline is not None:
+        return timeline
+    with timeline_lock(user_id, 0) as locked:
+        if Follow.objects.filter(
+                user_id=user_id).count() > settings.FEED_MAX_FOLLOWING:
+            timeline = FEED_PULL
+        else:
+            timeline = get_followed_recipe_ids(
+                user_id, None, settings.FEED_LENGTH)
+        if locked:
+            cache.set(key, timeline, settings.FEED_TIMEOUT)
+    return timeline
+
+
+def get_feed_ids(user_id: int, cursor: Optional[int],
+                 limit: int) -> List[int]:
+    """
+    limit id рецептов ленты после cursor (id < cursor):
+        - Срез хранимой ленты, начало находим бинарным поиском
+        - Если лента полная (FEED_LENGTH) и закончилась, остаток
+          страницы добираем запросом
+        - Для FEED_PULL - только запрос
+    """
+    timeline = get_timeline(user_id)
+    if timeline == FEED_PULL:
+        return get_followed_recipe_ids(user_id, cursor, limit)
+
+    start = 0 if cursor is None else bisect_right(
+        timeline, -cursor, key=lambda recipe_id: -recipe_id)
+    ids = timeline[start:start + limit]
+    if len(ids) < limit and len(timeline) >= settings.FEED_LENGTH:
+        ids += get_followed_recipe_ids(
+            user_id, ids[-1] if ids else cursor, limit - len(ids))
+    return ids
+
+
+def push_to_timelines(recipe_id: int, follower_ids: List[int]) -> int:
+    """
+    Fan-out при создании рецепта: добавляем recipe_id в ленты подписчиков
+    follower_ids, которые уже есть в кеше, с сохранением порядка по id.
+    Каждую ленту перечитываем и записываем под блокировкой, ленту, которую
+    не удалось заблокировать, сбрасываем. Остальные ленты соберутся при
+    чтении. Возвращает количество обновленных лент.
+    """
+    timelines = cache.get_many(
+        [get_timeline_key(user_id) for user_id in follower_ids])
+    updated = 0
+    for user_id in follower_ids:
+        key = get_timeline_key(user_id)
+        if timelines.get(key, FEED_PULL) == FEED_PULL:
+            continue
+        with timeline_lock(user_id, FEED_LOCK_TIMEOUT) as locked:
+            if not locked:
+                cache.delete(key)
+                continue
+            timeline = cache.get(key)
+            if timeline in (None, FEED_PULL) or recipe_id in timeline:
+                continue
+            insort(timeline, recipe_id, key=lambda item: -item)
+            cache.set(key, timeline[:settings.FEED_LENGTH],
+                      settings.FEED_TIMEOUT)
+            updated += 1
+    return updated
+
+
+def delete_timeline(user_id: int) -> None:
+    """
+    Подписки изменились - лента соберется заново при чтении. Удаляем под
+    блокировкой, чтобы идущая сборка не записала ленту по старым
+    подпискам после удаления.
+    """
+    with timeline_lock(user_id, FEED_LOCK_TIMEOUT):
+        cache.delete(get_timeline_key(user_id))
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+from typing import Dict
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+VARIANTS_DIR = 'recipes/variants'
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1200,
+}
+IMAGE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+IMAGE_QUALITY = 80
+
+
+def get_variants_dir(name: str) -> str:
+    """Папка вариантов картинки: recipes/variants/<имя без расширения>."""
+    stem, _ = os.path.splitext(os.path.basename(name))
+    return os.path.join(VARIANTS_DIR, stem)
+
+
+def resize(image: Image.Image, width: int) -> Image.Image:
+    """Уменьшаем картинку до ширины width, не увеличивая маленькие."""
+    if image.width <= width:
+        return image
+    height = round(image.height * width / image.width)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def build_variants(name: str) -> Dict:
+    """
+    Варианты картинки name из хранилища фиксированной ширины
+    (IMAGE_VARIANTS) в форматах webp и jpeg.
+    Возвращает карту для Recipe.image_variants:
+        {'source': name, 'thumbnail': {'width': 160, 'webp': путь,
+         'jpeg': путь}, ...}
+    """
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = image.convert('RGB')
+
+    directory = get_variants_dir(name)
+    variants = {'source': name}
+    for variant, width in IMAGE_VARIANTS.items():
+        resized = resize(image, width)
+        variants[variant] = {'width': resized.width}
+        for ext, format in IMAGE_FORMATS.items():
+            output = BytesIO()
+            resized.save(output, format, quality=IMAGE_QUALITY)
+            path = os.path.join(directory, f'{variant}.{ext}')
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[variant][ext] = default_storage.save(
+                path, ContentFile(output.getvalue()))
+    return variants
@@ -0,0 +1,137 @@
+import os
+from datetime import timedelta
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from django.core.files.storage import Storage, default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...images import VARIANTS_DIR
+from ...models import Recipe
+from ...storage import recipe_image_storage
+
+BATCH_SIZE = 500
+MIN_AGE_MINUTES = 60
+IMAGES_DIR = 'recipes'
+VARIANT_KEY = ('thumbnail', 'webp')
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_images(storage: Storage) -> Iterator[str]:
+    """Картинки рецептов: recipes/* и recipes/<xx>/*, кроме вариантов."""
+    dirs, files = storage.listdir(IMAGES_DIR)
+    for name in files:
+        yield os.path.join(IMAGES_DIR, name)
+    for directory in dirs:
+        path = os.path.join(IMAGES_DIR, directory)
+        if path == VARIANTS_DIR:
+            continue
+        for name in storage.listdir(path)[1]:
+            yield os.path.join(path, name)
+
+
+def iter_variant_dirs(storage: Storage) -> Iterator[str]:
+    """Папки вариантов картинок: recipes/variants/<имя картинки>."""
+    if not storage.exists(VARIANTS_DIR):
+        return
+    for directory in storage.listdir(VARIANTS_DIR)[0]:
+        yield os.path.join(VARIANTS_DIR, directory)
+
+
+def is_old(storage: Storage, name: str, min_age: timedelta) -> bool:
+    """
+    Свежие файлы не трогаем: картинка могла быть сохранена, а транзакция
+    с рецептом еще не закоммичена.
+    """
+    return storage.get_modified_time(name) < timezone.now() - min_age
+
+
+def collect_images(batch: List[str], min_age: timedelta) -> List[str]:
+    """Картинки из batch, на которые не ссылается ни один рецепт."""
+    used = set(Recipe.objects.filter(image__in=batch).values_list(
+        'image', flat=True))
+    return [
+        name for name in batch
+        if name not in used and is_old(recipe_image_storage, name, min_age)
+    ]
+
+
+def collect_variants(batch: List[str], min_age: timedelta) -> List[str]:
+    """
+    Файлы папок вариантов из batch, которые не записаны
+    в image_variants ни одного рецепта.
+    """
+    variant, ext = VARIANT_KEY
+    marker = f'{variant}.{ext}'
+    lookup = f'image_variants__{variant}__{ext}'
+    used = set(Recipe.objects.filter(**{
+        f'{lookup}__in': [os.path.join(path, marker) for path in batch]
+    }).values_list(lookup, flat=True))
+
+    unused = []
+    for path in batch:
+        if os.path.join(path, marker) in used:
+            continue
+        files = [os.path.join(path, name)
+                 for name in default_storage.listdir(path)[1]]
+        if all(is_old(default_storage, name, min_age) for name in files):
+            unused += files
+    return unused
+
+
+class Command(BaseCommand):
+    help = 'Удаление картинок рецептов, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество файлов, проверяемых за один запрос'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=MIN_AGE_MINUTES,
+            help='Не удалять файлы моложе указанного количества минут'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество неиспользуемых файлов'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        min_age = timedelta(minutes=options['min_age'])
+        if not recipe_image_storage.exists(IMAGES_DIR):
+            self.stdout.write(self.style.NOTICE('Картинок рецептов нет'))
+            return
+
+        deleted = 0
+        for storage, names, collect in (
+            (recipe_image_storage, iter_images(recipe_image_storage),
+             collect_images),
+            (default_storage, iter_variant_dirs(default_storage),
+             collect_variants),
+        ):
+            for batch in iter_batches(names, batch_size):
+                unused = collect(batch, min_age)
+                if not options['dry_run']:
+                    for name in unused:
+                        storage.delete(name)
+                deleted += len(unused)
+
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            self.style.SUCCESS(f'{action} неиспользуемых файлов: {deleted}')
+        )
@@ -1,41 +1,124 @@
 import csv
 import os
+import time
+from itertools import islice
 
 import django.db.utils
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 
+from ...catalog import INGREDIENTS_CATALOG, bump_catalog_version
 from ...models import Ingredient
 
 DATA_TABLES = {
     Ingredient: 'ingredients.csv',
 }
+CATALOGS = {
+    Ingredient: INGREDIENTS_CATALOG,
+}
+UNIQUE_FIELDS = {
+    Ingredient: ('name', 'measurement_unit'),
+}
+CHUNK_SIZE = 5000
 
 
-def read_csv(name_file):
-    """Считываем csv файл и добавляем к каждому элементу поле id."""
+def iter_csv(model, name_file):
+    """Построчно читаем csv файл, файл целиком в память не загружается."""
     path = os.path.join('static/data', name_file)
     with open(path, encoding='utf-8') as csv_file:
-        reader = csv.DictReader(csv_file,
-                                fieldnames=('name', 'measurement_unit'),
-                                delimiter=',',)
-        result = []
-        for i, elem in enumerate(reader):
-            elem['id'] = i + 1
-            result.append(elem)
-        return result
-
-
-def load_data(model, name_file):
-    """Загрузка данных по модели."""
-    table = read_csv(name_file)
-    model.objects.bulk_create(model(**row) for row in table)
+        yield from csv.DictReader(csv_file,
+                                  fieldnames=UNIQUE_FIELDS[model],
+                                  delimiter=',',)
+
+
+def iter_chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def upsert_chunk(model, rows):
+    """
+    Добавляем строки пачки, которых еще нет в таблице.
+    Уникальный ключ - UNIQUE_FIELDS, других полей у справочника нет,
+    поэтому существующие строки остаются без изменений.
+    Новые строки добавляются в порядке csv файла, дубликаты - по первому
+    вхождению.
+    Возвращает количество добавленных и неизмененных строк.
+    """
+    fields = UNIQUE_FIELDS[model]
+    keys = list(dict.fromkeys(
+        tuple(row[field] for field in fields) for row in rows))
+    existing = set(model.objects.filter(
+        **{f'{fields[0]}__in': {key[0] for key in keys}}
+    ).values_list(*fields))
+    new_keys = [key for key in keys if key not in existing]
+    model.objects.bulk_create(
+        [model(**dict(zip(fields, key))) for key in new_keys],
+        ignore_conflicts=True)
+    return len(new_keys), len(keys) - len(new_keys)
+
+
+def copy_upsert(model, name_file):
+    """
+    Postgres: файл целиком потоком через COPY FROM STDIN во временную
+    таблицу, затем один INSERT ... ON CONFLICT DO NOTHING.
+    Номер строки файла (line) сохраняет порядок csv: дубликаты
+    добавляются по первому вхождению.
+    """
+    fields = UNIQUE_FIELDS[model]
+    columns = ', '.join(fields)
+    table = model._meta.db_table
+    path = os.path.join('static/data', name_file)
+    with transaction.atomic(), connection.cursor() as cursor, open(
+            path, encoding='utf-8') as csv_file:
+        cursor.execute(
+            'CREATE TEMP TABLE staging (line bigserial, '
+            f'{", ".join(f"{field} text" for field in fields)}'
+            ') ON COMMIT DROP')
+        cursor.copy_expert(
+            f'COPY staging ({columns}) FROM STDIN WITH (FORMAT csv)',
+            csv_file)
+        cursor.execute(f'SELECT COUNT(*) FROM (SELECT DISTINCT {columns} '
+                       'FROM staging) AS keys')
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f'INSERT INTO {table} ({columns}) '
+            f'SELECT {columns} FROM staging '
+            f'GROUP BY {columns} ORDER BY MIN(line) '
+            f'ON CONFLICT ({columns}) DO NOTHING')
+        return cursor.rowcount, total - cursor.rowcount
+
+
+def load_data(model, name_file, chunk_size=CHUNK_SIZE):
+    """
+    Идемпотентная загрузка данных по модели: строки, которых нет
+    в таблице, добавляются, повторный запуск ничего не ломает.
+    Возвращает количество добавленных, обновленных и неизмененных строк.
+    """
+    if connection.vendor == 'postgresql':
+        inserted, unchanged = copy_upsert(model, name_file)
+    else:
+        inserted = unchanged = 0
+        for chunk in iter_chunks(iter_csv(model, name_file), chunk_size):
+            with transaction.atomic():
+                chunk_inserted, chunk_unchanged = upsert_chunk(model, chunk)
+            inserted += chunk_inserted
+            unchanged += chunk_unchanged
+    if inserted:
+        bump_catalog_version(CATALOGS[model])
+    return inserted, 0, unchanged
 
 
 def delete_data():
     """Удаление всех таблиц из базы данных."""
     for model in DATA_TABLES:
         model.objects.all().delete()
+        bump_catalog_version(CATALOGS[model])
 
 
 class Command(BaseCommand):
@@ -52,13 +135,26 @@ class Command(BaseCommand):
             action='store_true',
             help='Удаление всех данных из базы данных'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество строк csv в одной транзакции'
+        )
 
     def handle(self, *args, **options):
         try:
             if options['load']:
                 for model, name_file in DATA_TABLES.items():
-                    load_data(model, name_file)
-                    print(f'Загрузка "{name_file}" выполнена')
+                    started = time.monotonic()
+                    inserted, updated, unchanged = load_data(
+                        model, name_file, options['chunk_size'])
+                    self.stdout.write(
+                        f'Загрузка "{name_file}" выполнена за '
+                        f'{time.monotonic() - started:.2f} с: '
+                        f'добавлено {inserted}, обновлено {updated}, '
+                        f'без изменений {unchanged}'
+                    )
 
                 self.stdout.write(
                     self.style.SUCCESS('Данные загружены в базу данных.')
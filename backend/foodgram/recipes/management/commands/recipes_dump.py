@@ -0,0 +1,73 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import Recipe
+
+CHUNK_SIZE = 2000
+
+
+def recipe_to_record(recipe: Recipe) -> dict:
+    """
+    Запись рецепта для NDJSON: связанные объекты по естественным ключам -
+    автор по username, теги по slug, ингредиенты по названию и единице
+    измерения. Картинка - имя файла в хранилище.
+    """
+    return {
+        'id': recipe.id,
+        'author': recipe.author.username,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'image_variants': recipe.image_variants,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {'name': amount.ingredient.name,
+             'measurement_unit': amount.ingredient.measurement_unit,
+             'amount': amount.amount}
+            for amount in recipe.amountingredient_set.all()],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов в NDJSON: один рецепт - одна строка json'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество рецептов, читаемых из БД за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'amountingredient_set__ingredient').order_by('id')
+        output = (open(options['output'], 'w', encoding='utf-8')
+                  if options['output'] else sys.stdout)
+        started = time.monotonic()
+        count = 0
+        try:
+            for recipe in recipes.iterator(chunk_size=options['chunk_size']):
+                output.write(json.dumps(
+                    recipe_to_record(recipe), ensure_ascii=False))
+                output.write('\n')
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            self.style.SUCCESS(
+                f'Выгружено рецептов: {count} за {elapsed:.1f} с '
+                f'({count / max(elapsed, 1e-9):.0f} рецептов/с)'
+            )
+        )
@@ -0,0 +1,176 @@
+import json
+import os
+import time
+from io import StringIO
+from itertools import islice
+from typing import Dict, Iterable, List, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from users.models import User
+
+from ...catalog import RECIPES_CATALOG, bump_catalog_version
+from ...models import (AmountIngredient, Ingredient, LoadCheckpoint, Recipe,
+                       RecipeTag, Tag)
+from ...search import update_search_documents
+from .reconcile_counters import reconcile
+
+CHUNK_SIZE = 5000
+
+
+def copy_rows(model, fields: Tuple[str], rows: List[Tuple[int]]) -> None:
+    """
+    Запись строк из чисел в таблицу model: в Postgres через COPY,
+    в остальных БД через bulk_create.
+    """
+    if not rows:
+        return
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(
+            model(**dict(zip(fields, row))) for row in rows)
+        return
+    data = StringIO(''.join(
+        '\t'.join(map(str, row)) + '\n' for row in rows))
+    columns = ', '.join(model._meta.get_field(field).column
+                        for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {model._meta.db_table} ({columns}) FROM STDIN', data)
+
+
+def read_checkpoint(name: str) -> int:
+    """Количество строк файла, загруженных при прошлом запуске."""
+    return LoadCheckpoint.objects.filter(name=name).values_list(
+        'lines', flat=True).first() or 0
+
+
+def iter_chunks(lines: Iterable[str], size: int) -> Iterable[List[str]]:
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_chunk(records: List[dict], tags: Dict[str, int],
+               ingredients: Dict[Tuple[str, str], int],
+               checkpoint: str, lines: int) -> Tuple[int, int]:
+    """
+    Загрузка пачки рецептов в одной транзакции:
+        - Авторов ищем одним IN запросом, теги и ингредиенты - по
+          справочникам в памяти
+        - Рецепты со ссылками на несуществующие объекты пропускаем
+        - Рецепты создаем через bulk_create, теги и ингредиенты - через
+          COPY в Postgres
+        - Текст для поиска и прогресс загрузки (lines строк файла)
+          пишем в той же транзакции: после сбоя пачка не загрузится дважды
+    Возвращает количество загруженных и пропущенных рецептов.
+    """
+    authors = dict(User.objects.filter(
+        username__in={record.get('author') for record in records}
+    ).values_list('username', 'id'))
+
+    recipes, relations = [], []
+    for record in records:
+        try:
+            tag_ids = list(dict.fromkeys(
+                tags[slug] for slug in record['tags']))
+            amounts = {}
+            for item in record['ingredients']:
+                amounts.setdefault(
+                    ingredients[item['name'], item['measurement_unit']],
+                    item['amount'])
+            recipe = Recipe(
+                author_id=authors[record['author']],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=record['image'],
+                image_variants=record.get('image_variants') or {},
+            )
+        except KeyError:
+            continue
+        recipes.append(recipe)
+        relations.append((tag_ids, amounts))
+
+    with transaction.atomic():
+        Recipe.objects.bulk_create(recipes)
+        copy_rows(RecipeTag, ('recipe_id', 'tag_id'), [
+            (recipe.id, tag_id)
+            for recipe, (tag_ids, _) in zip(recipes, relations)
+            for tag_id in tag_ids])
+        copy_rows(
+            AmountIngredient, ('recipe_id', 'ingredient_id', 'amount'), [
+                (recipe.id, ingredient_id, amount)
+                for recipe, (_, amounts) in zip(recipes, relations)
+                for ingredient_id, amount in amounts.items()])
+        update_search_documents(recipe.id for recipe in recipes)
+        LoadCheckpoint.objects.update_or_create(
+            name=checkpoint, defaults={'lines': lines})
+    return len(recipes), len(records) - len(recipes)
+
+
+class Command(BaseCommand):
+    help = 'Загрузка рецептов из NDJSON, выгруженного recipes_dump'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='NDJSON файл с рецептами')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество рецептов в одной транзакции'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя записи LoadCheckpoint с количеством загруженных строк, '
+                 'по умолчанию абсолютный путь к <input>. Повторный запуск '
+                 'продолжает загрузку с места остановки'
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = (options['checkpoint']
+                      or os.path.abspath(options['input']))
+        done = read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(
+                self.style.NOTICE(f'Продолжаем загрузку со строки {done + 1}')
+            )
+
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        ingredients = {
+            (name, measurement_unit): id
+            for name, measurement_unit, id in Ingredient.objects.order_by(
+                '-id').values_list('name', 'measurement_unit', 'id')}
+
+        started = time.monotonic()
+        loaded = skipped = 0
+        with open(options['input'], encoding='utf-8') as file:
+            lines = islice(file, done, None)
+            for chunk in iter_chunks(lines, options['chunk_size']):
+                records = [json.loads(line) for line in chunk if line.strip()]
+                done += len(chunk)
+                chunk_loaded, chunk_skipped = load_chunk(
+                    records, tags, ingredients, checkpoint, done)
+                loaded += chunk_loaded
+                skipped += chunk_skipped
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Загружено рецептов: {loaded}, пропущено: {skipped} '
+                    f'({loaded / max(elapsed, 1e-9):.0f} рецептов/с)'
+                )
+
+        LoadCheckpoint.objects.filter(name=checkpoint).delete()
+        # bulk_create не отправляет сигналы: обновляем версию списка
+        # рецептов и счетчики рецептов авторов
+        bump_catalog_version(RECIPES_CATALOG)
+        reconcile(User, 'recipes_count', Recipe, 'author',
+                  options['chunk_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Загрузка завершена: {loaded} рецептов за '
+                f'{time.monotonic() - started:.1f} с'
+            )
+        )
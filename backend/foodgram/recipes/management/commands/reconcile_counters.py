@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import Follow, User
+
+from ...models import Favorite, Recipe, ShoppingCart
+
+BATCH_SIZE = 1000
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def get_actual_count(related_model, field: str) -> Coalesce:
+    """Подзапрос с фактическим количеством связанных записей."""
+    count = related_model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(
+        Subquery(count, output_field=IntegerField()), 0)
+
+
+def reconcile(model, counter: str, related_model, field: str,
+              batch_size: int) -> int:
+    """
+    Сверка счетчика counter модели model с таблицей related_model.
+        - Идем по таблице пачками по batch_size записей в порядке pk
+        - В пачке выбираем id записей, у которых счетчик разошелся
+          с фактическим количеством, и пересчитываем только их
+    Возвращает количество исправленных записей.
+    """
+    actual = get_actual_count(related_model, field)
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return fixed
+        last_pk = batch[-1]
+        drifted = list(model.objects.filter(pk__in=batch).annotate(
+            actual=actual).exclude(actual=F(counter)).values_list(
+            'pk', flat=True))
+        if drifted:
+            fixed += model.objects.filter(pk__in=drifted).update(
+                **{counter: actual})
+
+
+class Command(BaseCommand):
+    help = 'Сверка денормализованных счетчиков с фактическими данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество записей, проверяемых за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        for model, counter, related_model, field in COUNTERS:
+            fixed = reconcile(model, counter, related_model, field,
+                              options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{model._meta.model_name}.{counter}: '
+                    f'исправлено записей - {fixed}'
+                )
+            )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...models import Recipe
+from ...search import FTS_TABLE, update_search_documents
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересчет текста для полнотекстового поиска рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество рецептов, пересчитываемых за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Идем по рецептам пачками в порядке pk и пересчитываем
+        search_document. В SQLite таблица FTS5 собирается заново.
+        """
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+        indexed = 0
+        last_pk = 0
+        while True:
+            batch = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            indexed += update_search_documents(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Проиндексировано рецептов - {indexed}'
+            )
+        )
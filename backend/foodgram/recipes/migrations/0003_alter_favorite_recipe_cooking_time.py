@@ -0,0 +1,25 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:17
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipetag_tag_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favorite',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to='recipes.recipe'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.IntegerField(validators=[django.core.validators.MaxValueValidator(500, message='Максимальное количесвто 500 мин.'), django.core.validators.MinValueValidator(1, message='Минимальное количесвто 1 минута')], verbose_name='Время приготовления'),
+        ),
+    ]
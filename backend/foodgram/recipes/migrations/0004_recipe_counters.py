@@ -0,0 +1,44 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(related_model, field):
+    """Подзапрос с количеством связанных записей, 0 если их нет."""
+    count = related_model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(count, output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    """Счетчики существующих рецептов по фактическим данным."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=count_related(
+            apps.get_model('recipes', 'Favorite'), 'recipe'),
+        in_carts_count=count_related(
+            apps.get_model('recipes', 'ShoppingCart'), 'recipe'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_alter_favorite_recipe_cooking_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+SEARCH_VECTOR = ("to_tsvector('russian', "
+                 'recipes_recipe.search_document)')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_idx '
+            f'ON recipes_recipe USING gin (({SEARCH_VECTOR}))')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING '
+            "fts5(search_document, tokenize='unicode61 remove_diacritics 2')")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipes_recipe_search_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredient_unique_name_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:41
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# Существующим записям - дата вне окна трендов, иначе все они считались бы
+# добавленными в момент миграции
+EXISTING_ROWS_CREATED = datetime.datetime(
+    1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.recipe')),
+                ('popular_score', models.PositiveIntegerField(default=0, verbose_name='Популярность')),
+                ('trending_score', models.PositiveIntegerField(default=0, verbose_name='Популярность за последнее время')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=EXISTING_ROWS_CREATED, verbose_name='Добавлен'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=EXISTING_ROWS_CREATED, verbose_name='Добавлен'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-popular_score', '-recipe'], name='ranking_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperanking',
+            index=models.Index(fields=['-trending_score', '-recipe'], name='ranking_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.8 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Загрузка')),
+                ('lines', models.PositiveIntegerField(default=0, verbose_name='Загружено строк')),
+            ],
+            options={
+                'verbose_name': 'Прогресс загрузки',
+                'verbose_name_plural': 'Прогресс загрузок',
+            },
+        ),
+    ]
@@ -1,7 +1,10 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 from users.models import User
 
+from .storage import recipe_image_storage
+
 MIN_OF_AMOUNT = 1
 MAX_OF_AMOUNT = 5000
 MIN_OF_COOKING_TIME = 1
@@ -67,10 +70,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
-
-    class Meta:
-        verbose_name = 'Ингредиент'
-        verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_name_measurement_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -83,10 +88,14 @@ class Recipe(models.Model):
         - author: Автор рецепта
         - name: Название
         - image: Картинка
+        - image_variants: Уменьшенные копии картинки в webp и jpeg
         - description: Описание
         - ingredients: Ингрединты
         - tags: Тэги
         - cooking_time: Время приготовления
+        - search_document: Текст для полнотекстового поиска
+        - favorites_count: Сколько раз добавлен в избранное
+        - in_carts_count: В скольких корзинах находится
     """
     author = models.ForeignKey(
         User,
@@ -106,9 +115,15 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='recipes/',
+        storage=recipe_image_storage,
         null=False,
         blank=False
     )
+    image_variants = models.JSONField(
+        'Варианты картинки',
+        default=dict,
+        blank=True,
+    )
     text = models.TextField(
         'Описание',
         max_length=MAX_LENGTH_OF_DESCRIPTION,
@@ -140,11 +155,31 @@ class Recipe(models.Model):
         null=False,
         blank=False
     )
+    search_document = models.TextField(
+        'Текст для поиска',
+        default='',
+        blank=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('author', '-id'),
+                name='recipe_author_id_idx',
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -198,6 +233,12 @@ class RecipeTag(models.Model):
     class Meta:
         verbose_name = 'Теги рецепта'
         verbose_name_plural = 'Теги рецептов'
+        indexes = [
+            models.Index(
+                fields=('tag', 'recipe'),
+                name='recipetag_tag_recipe_idx',
+            )
+        ]
 
 
 class Favorite(models.Model):
@@ -206,10 +247,16 @@ class Favorite(models.Model):
     Attributes:
         - user: FK to User model
         - recipe: FK to Recipe model
+        - created: Когда добавлен
     """
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='favorites')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(
+        'Добавлен',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ('-id',)
@@ -230,9 +277,15 @@ class ShoppingCart(models.Model):
     Attributes:
         - user: FK to User model
         - recipe: FK to Recipe model
+        - created: Когда добавлен
     """
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created = models.DateTimeField(
+        'Добавлен',
+        default=timezone.now,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ('-id',)
@@ -245,3 +298,68 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+
+
+class RecipeRanking(models.Model):
+    """
+    Рейтинги рецептов, пересчитываются задачей celery beat.
+    Attributes:
+        - recipe: OneToOne to Recipe model
+        - popular_score: Добавлений в избранное и корзины за все время
+        - trending_score: Добавлений в избранное и корзины за последние
+          TRENDING_WINDOW секунд
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+    )
+    popular_score = models.PositiveIntegerField(
+        'Популярность',
+        default=0,
+    )
+    trending_score = models.PositiveIntegerField(
+        'Популярность за последнее время',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=('-popular_score', '-recipe'),
+                name='ranking_popular_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-recipe'),
+                name='ranking_trending_idx',
+            ),
+        ]
+
+
+class LoadCheckpoint(models.Model):
+    """
+    Прогресс загрузки рецептов командой recipes_load, пишется в той же
+    транзакции, что и пачка рецептов.
+    Attributes:
+        - name: Имя загрузки, по умолчанию абсолютный путь к файлу
+        - lines: Количество загруженных строк файла
+    """
+    name = models.CharField(
+        'Загрузка',
+        max_length=255,
+        unique=True,
+    )
+    lines = models.PositiveIntegerField(
+        'Загружено строк',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Прогресс загрузки'
+        verbose_name_plural = 'Прогресс загрузок'
+
+    def __str__(self):
+        return f'{self.name}: {self.lines}'
@@ -0,0 +1,71 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from .models import Favorite, Recipe, RecipeRanking, ShoppingCart
+
+BATCH_SIZE = 1000
+
+
+def get_trending_scores() -> Counter:
+    """
+    Добавления в избранное и корзины за последние TRENDING_WINDOW секунд
+    по рецептам: два GROUP BY по индексу created.
+    """
+    since = timezone.now() - timedelta(seconds=settings.TRENDING_WINDOW)
+    scores = Counter()
+    for model in (Favorite, ShoppingCart):
+        scores.update(dict(
+            model.objects.filter(created__gte=since).order_by().values_list(
+                'recipe').annotate(count=Count('id'))))
+    return scores
+
+
+def refresh_rankings(batch_size: int = BATCH_SIZE) -> int:
+    """
+    Пересчет таблицы RecipeRanking:
+        - popular_score - сумма счетчиков favorites_count и in_carts_count
+        - trending_score - добавления за окно TRENDING_WINDOW
+        - Идем по рецептам пачками в порядке id и записываем только
+          изменившиеся рейтинги одним upsert-ом на пачку
+    Возвращает количество обновленных рейтингов.
+    """
+    trending = get_trending_scores()
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(Recipe.objects.filter(id__gt=last_id).order_by(
+            'id').values_list(
+            'id', 'favorites_count', 'in_carts_count',
+            'ranking__popular_score', 'ranking__trending_score')[:batch_size])
+        if not batch:
+            return updated
+        last_id = batch[-1][0]
+        changed = [
+            RecipeRanking(recipe_id=recipe_id,
+                          popular_score=favorites + in_carts,
+                          trending_score=trending[recipe_id])
+            for recipe_id, favorites, in_carts, popular, trending_score
+            in batch
+            if (popular, trending_score) != (
+                favorites + in_carts, trending[recipe_id])]
+        RecipeRanking.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=('recipe',),
+            update_fields=('popular_score', 'trending_score'))
+        updated += len(changed)
+
+
+def order_by_popular(queryset: QuerySet) -> QuerySet:
+    """Сначала популярные, рецепты без рейтинга - в конце."""
+    return queryset.order_by(
+        F('ranking__popular_score').desc(nulls_last=True), '-id')
+
+
+def get_trending(queryset: QuerySet) -> QuerySet:
+    """Рецепты с добавлениями за окно TRENDING_WINDOW, сначала частые."""
+    return queryset.filter(ranking__trending_score__gt=0).order_by(
+        '-ranking__trending_score', '-id')
@@ -0,0 +1,106 @@
+import re
+from typing import Iterable, List
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.query import QuerySet
+
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+SEARCH_VECTOR = (f"to_tsvector('{SEARCH_CONFIG}', "
+                 f'{Recipe._meta.db_table}.search_document)')
+WORD_RE = re.compile(r'\w+')
+
+
+def build_search_document(recipe: Recipe) -> str:
+    """Текст для поиска: название, описание, теги и ингредиенты рецепта."""
+    return '\n'.join((
+        recipe.name,
+        recipe.text,
+        ' '.join(tag.name for tag in recipe.tags.all()),
+        ' '.join(ingredient.name for ingredient in recipe.ingredients.all()),
+    ))
+
+
+def update_search_documents(recipe_ids: Iterable[int]) -> int:
+    """
+    Пересчет search_document рецептов recipe_ids одним bulk_update,
+    в SQLite заодно обновляем строки таблицы FTS5.
+    Сигналы не отправляются. Возвращает количество рецептов.
+    """
+    recipes = list(Recipe.objects.filter(id__in=list(recipe_ids)).only(
+        'id', 'name', 'text').prefetch_related('tags', 'ingredients'))
+    for recipe in recipes:
+        recipe.search_document = build_search_document(recipe)
+    Recipe.objects.bulk_update(recipes, ('search_document',))
+    if connection.vendor == 'sqlite':
+        delete_fts_rows([recipe.id for recipe in recipes])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, search_document) '
+                'VALUES (%s, %s)',
+                [(recipe.id, recipe.search_document) for recipe in recipes])
+    return len(recipes)
+
+
+def schedule_search_update(recipe_id: int) -> None:
+    """
+    Пересчет search_document рецепта после коммита транзакции, когда
+    теги и ингредиенты рецепта уже записаны.
+    """
+    transaction.on_commit(lambda: update_search_documents([recipe_id]))
+
+
+def delete_fts_rows(recipe_ids: List[int]) -> None:
+    """Удаление рецептов из таблицы FTS5 (только SQLite)."""
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+            f'({", ".join(["%s"] * len(recipe_ids))})', recipe_ids)
+
+
+def get_fts_query(query: str) -> str:
+    """
+    Запрос FTS5 из слов запроса: каждое слово - префикс ("мук"*),
+    так без стемминга находятся разные формы слова.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def search_recipes(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Рецепты queryset, подходящие под query, с релевантностью search_rank,
+    сначала самые релевантные:
+        - Postgres: websearch_to_tsquery по GIN индексу, ранг ts_rank
+        - SQLite: MATCH по таблице FTS5, ранг bm25
+        - Другие БД: вхождение подстроки в search_document
+    """
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = queryset.filter(RawSQL(
+            f'{SEARCH_VECTOR} @@ {tsquery}', (query,),
+            output_field=BooleanField())).annotate(search_rank=RawSQL(
+                f'ts_rank({SEARCH_VECTOR}, {tsquery})', (query,),
+                output_field=FloatField()))
+    elif vendor == 'sqlite':
+        fts_query = get_fts_query(query)
+        if not fts_query:
+            return queryset.none()
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (fts_query,))).annotate(search_rank=RawSQL(
+                f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid = {Recipe._meta.db_table}.id', (fts_query,),
+                output_field=FloatField()))
+    else:
+        queryset = queryset.filter(Q(
+            *(Q(search_document__icontains=word)
+              for word in WORD_RE.findall(query)))).annotate(
+            search_rank=RawSQL('0', (), output_field=FloatField()))
+    return queryset.order_by('-search_rank', '-id')
@@ -0,0 +1,188 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from users.models import Follow, User
+
+from foodgram.counters import get_delta, shift_counter
+
+from .catalog import (INGREDIENTS_CATALOG, RECIPES_CATALOG, TAGS_CATALOG,
+                      bump_catalog_version)
+from .feed import delete_timeline
+from .models import (AmountIngredient, Favorite, Ingredient, Recipe, RecipeTag,
+                     ShoppingCart, Tag)
+from .search import delete_fts_rows, schedule_search_update
+from .tasks import (build_image_variants, fan_out_recipe,
+                    update_related_search_documents)
+from .user_state import FAVORITES, FOLLOWING, SHOPPING_CART, bump_user_state
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def bump_cart_version(sender, instance: ShoppingCart, **kwargs) -> None:
+    """
+    При добавлении или удалении рецепта из корзины увеличиваем версию
+    корзины пользователя, закешированный pdf файл становится неактуальным.
+    """
+    if kwargs.get('created') is False:
+        return
+    User.objects.filter(id=instance.user_id).update(
+        cart_version=F('cart_version') + 1)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs) -> None:
+    """Изменение ингредиента - новая версия справочника ингредиентов."""
+    transaction.on_commit(lambda: bump_catalog_version(INGREDIENTS_CATALOG))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs) -> None:
+    """Изменение тега - новая версия справочника тегов."""
+    transaction.on_commit(lambda: bump_catalog_version(TAGS_CATALOG))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=AmountIngredient)
+@receiver(post_delete, sender=AmountIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def bump_recipes_version(sender, **kwargs) -> None:
+    """
+    Создание, изменение или удаление рецепта, его тегов или ингредиентов -
+    новая версия списка рецептов, закешированные количества рецептов и
+    ответы api становятся неактуальными. Версию поднимаем после коммита:
+    иначе параллельный запрос успеет закешировать ответ со старыми данными
+    под новой версией.
+    """
+    transaction.on_commit(lambda: bump_catalog_version(RECIPES_CATALOG))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipes_count(sender, instance: Recipe, signal, **kwargs) -> None:
+    """Счетчик рецептов автора."""
+    delta = get_delta(signal, **kwargs)
+    if delta:
+        shift_counter(User.objects.filter(id=instance.author_id),
+                      'recipes_count', delta)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def update_favorites_count(sender, instance: Favorite, signal,
+                           **kwargs) -> None:
+    """
+    Счетчик добавлений рецепта в избранное. Счетчик выводится в рецептах:
+    закешированные ответы api после коммита становятся неактуальными.
+    """
+    delta = get_delta(signal, **kwargs)
+    if delta:
+        shift_counter(Recipe.objects.filter(id=instance.recipe_id),
+                      'favorites_count', delta)
+        transaction.on_commit(lambda: bump_catalog_version(RECIPES_CATALOG))
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def update_in_carts_count(sender, instance: ShoppingCart, signal,
+                          **kwargs) -> None:
+    """
+    Счетчик корзин, в которых находится рецепт. Как и счетчик избранного,
+    выводится в рецептах - после коммита поднимаем версию рецептов.
+    """
+    delta = get_delta(signal, **kwargs)
+    if delta:
+        shift_counter(Recipe.objects.filter(id=instance.recipe_id),
+                      'in_carts_count', delta)
+        transaction.on_commit(lambda: bump_catalog_version(RECIPES_CATALOG))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Картинка рецепта сменилась - после коммита транзакции строим ее
+    варианты в celery.
+    """
+    if kwargs.get('raw') or not instance.image:
+        return
+    if instance.image_variants.get('source') == instance.image.name:
+        return
+    transaction.on_commit(
+        lambda: build_image_variants.delay(instance.id))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_document(sender, instance: Recipe,
+                                  **kwargs) -> None:
+    """
+    Рецепт сохранен - после коммита пересчитываем текст для поиска.
+    Теги и ингредиенты сохраняются после рецепта в той же транзакции.
+    """
+    if not kwargs.get('raw'):
+        schedule_search_update(instance.id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_search_document(sender, instance, action: str,
+                                **kwargs) -> None:
+    """Теги рецепта изменены через recipe.tags.set/add/remove/clear."""
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        schedule_search_update(instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_recipe_search_document(sender, instance: Recipe,
+                                  **kwargs) -> None:
+    delete_fts_rows([instance.id])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_catalog_search_documents(sender, instance, **kwargs) -> None:
+    """
+    Тег или ингредиент переименован - в celery пересчитываем текст для
+    поиска всех рецептов с ним.
+    """
+    if kwargs.get('created') or kwargs.get('raw'):
+        return
+    lookup = 'tags' if sender is Tag else 'ingredients'
+    transaction.on_commit(
+        lambda: update_related_search_documents.delay(lookup, instance.id))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_fan_out(sender, instance: Recipe, **kwargs) -> None:
+    """Новый рецепт после коммита добавляем в ленты подписчиков автора."""
+    if kwargs.get('created') and not kwargs.get('raw'):
+        transaction.on_commit(
+            lambda: fan_out_recipe.delay(instance.id, instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_timeline(sender, instance: Follow, **kwargs) -> None:
+    """
+    Подписка или отписка - после коммита лента подписчика собирается
+    заново.
+    """
+    transaction.on_commit(lambda: delete_timeline(instance.user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_user_state(sender, instance, **kwargs) -> None:
+    """
+    Избранное, корзина или подписки пользователя изменились - после
+    коммита меняем версию их множества id в кеше.
+    """
+    kind = {Favorite: FAVORITES, ShoppingCart: SHOPPING_CART,
+            Follow: FOLLOWING}[sender]
+    transaction.on_commit(lambda: bump_user_state(instance.user_id, kind))
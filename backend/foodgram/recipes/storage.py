@@ -0,0 +1,61 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.functional import cached_property
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла - sha256 его содержимого:
+    recipe.png -> <папка>/ab/abcdef...png.
+        - Одинаковые файлы хранятся один раз, повторная загрузка той же
+          картинки не пишет на диск, а возвращает имя существующего файла
+        - Подбирать свободное имя с суффиксом не нужно
+    Неиспользуемые файлы удаляет команда gc_media.
+    """
+    def get_content_name(self, name: str, content: File) -> str:
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        _, ext = os.path.splitext(name)
+        return os.path.join(
+            os.path.dirname(name), digest[:2], f'{digest}{ext.lower()}')
+
+    def save(self, name: str, content, max_length: int = None) -> str:
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            return name
+        content.seek(0)
+        return super().save(name, content, max_length)
+
+
+class PrivateStorage(FileSystemStorage):
+    """
+    Хранилище в PRIVATE_MEDIA_ROOT, вне MEDIA_ROOT:
+        - nginx эту папку не раздает, ссылок на файлы нет
+        - Файлы отдаются только через api после проверки прав
+    """
+    @cached_property
+    def base_location(self) -> str:
+        return self._value_or_setting(
+            self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    def _clear_cached_properties(self, setting: str, **kwargs) -> None:
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+recipe_image_storage = ContentAddressedStorage()
+private_storage = PrivateStorage()
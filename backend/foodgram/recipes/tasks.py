@@ -0,0 +1,76 @@
+from typing import Optional
+
+from users.models import Follow
+
+from foodgram.celery import app
+
+from .catalog import RECIPES_CATALOG, bump_catalog_version
+from .feed import push_to_timelines
+from .images import build_variants
+from .models import Recipe
+from .rankings import refresh_rankings
+from .search import update_search_documents
+
+SEARCH_BATCH_SIZE = 1000
+FAN_OUT_BATCH_SIZE = 1000
+
+
+@app.task
+def build_image_variants(recipe_id: int) -> Optional[str]:
+    """
+    Формирование вариантов картинки рецепта после его сохранения.
+        - Если рецепта или файла картинки уже нет, ничего не делаем
+        - Карту вариантов записываем, только если картинка рецепта
+          не сменилась, пока варианты строились, и меняем версию списка
+          рецептов - закешированные ответы api получат image_srcset
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return None
+    name = recipe.image.name
+    try:
+        variants = build_variants(name)
+    except FileNotFoundError:
+        return None
+    if Recipe.objects.filter(id=recipe_id, image=name).update(
+            image_variants=variants):
+        bump_catalog_version(RECIPES_CATALOG)
+    return name
+
+
+@app.task
+def update_related_search_documents(lookup: str, value: int) -> int:
+    """
+    Пересчет search_document рецептов после переименования тега или
+    ингредиента: рецепты Recipe.objects.filter(lookup=value) пачками.
+    """
+    ids = list(Recipe.objects.filter(**{lookup: value}).values_list(
+        'id', flat=True))
+    for start in range(0, len(ids), SEARCH_BATCH_SIZE):
+        update_search_documents(ids[start:start + SEARCH_BATCH_SIZE])
+    return len(ids)
+
+
+@app.task
+def fan_out_recipe(recipe_id: int, author_id: int) -> int:
+    """
+    Добавление нового рецепта в ленты подписчиков автора: подписчиков
+    выбираем пачками по FAN_OUT_BATCH_SIZE в порядке id.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(Follow.objects.filter(
+            following_id=author_id, id__gt=last_id).order_by('id').values_list(
+            'id', 'user_id')[:FAN_OUT_BATCH_SIZE])
+        if not batch:
+            return updated
+        last_id = batch[-1][0]
+        updated += push_to_timelines(
+            recipe_id, [user_id for _, user_id in batch])
+
+
+@app.task
+def refresh_recipe_rankings() -> int:
+    """Пересчет рейтингов рецептов, запускается celery beat."""
+    return refresh_rankings()
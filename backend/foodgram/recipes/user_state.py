@@ -0,0 +1,58 @@
+from typing import Dict, Set
+
+from django.core.cache import cache
+from users.models import Follow
+
+from .catalog import bump_catalog_version, get_catalog_versions
+from .models import Favorite, ShoppingCart
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+FOLLOWING = 'following'
+USER_STATE_TIMEOUT = 60 * 60 * 24
+
+USER_STATE_QUERIES = {
+    FAVORITES: lambda user_id: Favorite.objects.filter(
+        user_id=user_id).values_list('recipe_id', flat=True),
+    SHOPPING_CART: lambda user_id: ShoppingCart.objects.filter(
+        user_id=user_id).values_list('recipe_id', flat=True),
+    FOLLOWING: lambda user_id: Follow.objects.filter(
+        user_id=user_id).values_list('following_id', flat=True),
+}
+
+
+def get_user_state_catalog(user_id: int, kind: str) -> str:
+    """Версия множества хранится как версия справочника recipes.catalog."""
+    return f'user_state:{user_id}:{kind}'
+
+
+def get_user_state(user_id: int) -> Dict[str, Set[int]]:
+    """
+    Множества id избранных рецептов, рецептов в корзине и авторов из
+    подписок пользователя. Ключ множества содержит его версию: запрос,
+    прочитавший БД до изменения, запишет множество под старой версией,
+    которую уже никто не читает.
+    Недостающие множества выбираются из БД и кешируются.
+    """
+    kinds = list(USER_STATE_QUERIES)
+    versions = get_catalog_versions(
+        get_user_state_catalog(user_id, kind) for kind in kinds)
+    keys = {kind: f'{get_user_state_catalog(user_id, kind)}:{version}'
+            for kind, version in zip(kinds, versions)}
+    cached = cache.get_many(keys.values())
+    state = {}
+    missing = {}
+    for kind, key in keys.items():
+        if key in cached:
+            state[kind] = cached[key]
+        else:
+            state[kind] = missing[key] = set(
+                USER_STATE_QUERIES[kind](user_id))
+    if missing:
+        cache.set_many(missing, USER_STATE_TIMEOUT)
+    return state
+
+
+def bump_user_state(user_id: int, kind: str) -> None:
+    """Множество изменилось - новая версия, старое истечет само."""
+    bump_catalog_version(get_user_state_catalog(user_id, kind))
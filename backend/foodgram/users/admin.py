@@ -6,6 +6,7 @@ from .models import Follow, User
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name',)
+    readonly_fields = ('cart_version', 'recipes_count', 'followers_count')
     search_fields = ('username', 'first_name', 'email')
     list_filter = ('username', 'first_name', 'email')
     empty_value_display = '-пусто-'
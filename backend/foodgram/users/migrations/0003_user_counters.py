@@ -0,0 +1,45 @@
+# Generated by Django 4.1.8 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(related_model, field):
+    """Подзапрос с количеством связанных записей, 0 если их нет."""
+    count = related_model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(count, output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    """Счетчики существующих пользователей по фактическим данным."""
+    User = apps.get_model('users', 'User')
+    User.objects.update(
+        recipes_count=count_related(
+            apps.get_model('recipes', 'Recipe'), 'author'),
+        followers_count=count_related(
+            apps.get_model('users', 'Follow'), 'following'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_cart_version'),
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,9 @@ class User(AbstractUser):
         email: почта пользователя.
         first_name: имя.
         last_name: фамилия.
+        cart_version: версия корзины, растет при каждом ее изменении.
+        recipes_count: количество рецептов пользователя.
+        followers_count: количество подписчиков.
     """
     username = models.CharField(
         max_length=150,
@@ -35,6 +38,18 @@ class User(AbstractUser):
         null=False,
         blank=False
     )
+    cart_version = models.PositiveIntegerField(
+        'Версия корзины',
+        default=0,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
 
     class Meta:
         ordering = ('id',)
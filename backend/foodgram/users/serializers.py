@@ -1,7 +1,9 @@
 from collections import OrderedDict
 
+from api.serializers import ImageSrcsetField
 from recipes.models import Recipe
-from rest_framework.serializers import (CharField, EmailField, ListSerializer,
+from rest_framework.serializers import (BooleanField, CharField, EmailField,
+                                        IntegerField, ListSerializer,
                                         ModelSerializer, Serializer,
                                         SerializerMethodField)
 
@@ -16,7 +18,7 @@ class InfoSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed', )
+                  'is_subscribed', 'followers_count', )
 
     def get_is_subscribed(self, obj: Follow) -> bool:
         request = self.context.get('request')
@@ -69,37 +71,30 @@ class ChangePasswordSerializer(Serializer):
 
 class RecipeInfoSerializer(ModelSerializer):
     """Информация о рецепте, для подписки на пользователя."""
+    image_srcset = ImageSrcsetField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_srcset', 'cooking_time')
 
 
 class SubInfoSerializer(ModelSerializer):
-    """Сериализация данных при подписке на пользователя."""
-    recipes = RecipeInfoSerializer(read_only=True, many=True)
+    """
+    Сериализация данных при подписке на пользователя.
+    Автор приходит из UserService.get_subscriptions и attach_recipes:
+    recipes_count и followers_count - счетчики автора, is_subscribed -
+    аннотация, recipes - уже ограниченные recipes_limit рецепты.
+    """
+    recipes = RecipeInfoSerializer(
+        read_only=True, many=True, source='limited_recipes')
+    is_subscribed = BooleanField(read_only=True)
+    recipes_count = IntegerField(read_only=True)
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'recipes')
-
-    def to_representation(self, instance: User) -> OrderedDict:
-        """
-        Добавляем поля is_subscribed, recipes_count в запрос и ограничиваем
-        вывод рецептов исходя из переданного лимита.
-        """
-        data = super().to_representation(instance)
-        request = self.context.get('request')
-
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            data['recipes'] = data['recipes'][:int(limit)]
-
-        user = request.user
-        data['is_subscribed'] = Follow.objects.filter(
-            user=user, following=instance).exists()
-        data['recipes_count'] = len(data['recipes'])
-        return data
+                  'recipes', 'is_subscribed', 'recipes_count',
+                  'followers_count')
 
 
 class SubscriptionSerializer(ListSerializer):
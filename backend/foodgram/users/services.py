@@ -1,8 +1,12 @@
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from typing import List, Optional
 
 from django.contrib.auth.hashers import check_password
+from django.db.models import Value
+from django.db.models.query import QuerySet
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from recipes.models import Recipe
 from rest_framework.request import Request
 
 from .exceptions import WrongData
@@ -57,3 +61,49 @@ class UserService:
         return Follow.objects.filter(
             user=None if request.user.is_anonymous else request.user,
             following=obj).exists()
+
+    def get_recipes_limit(self, request: Request) -> Optional[int]:
+        """Лимит рецептов автора из параметра recipes_limit."""
+        limit = request.query_params.get('recipes_limit', '')
+        return int(limit) if limit.isdigit() else None
+
+    def get_subscriptions(self, user: User) -> QuerySet:
+        """
+        Авторы, на которых подписан user.
+        recipes_count - денормализованный счетчик автора, без COUNT.
+        """
+        return User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True)).order_by('id')
+
+    def attach_recipes(self, authors: List[User],
+                       limit: Optional[int]) -> List[User]:
+        """
+        Одним запросом выбираем не больше limit последних рецептов каждого
+        автора (ROW_NUMBER() OVER (PARTITION BY author_id)) и записываем
+        их в author.limited_recipes.
+        """
+        author_ids = [author.id for author in authors]
+        if not author_ids:
+            return authors
+
+        if limit is None:
+            recipes = Recipe.objects.filter(author_id__in=author_ids)
+        else:
+            placeholders = ', '.join(['%s'] * len(author_ids))
+            recipes = Recipe.objects.raw(
+                'SELECT * FROM ('
+                '    SELECT *, ROW_NUMBER() OVER ('
+                '        PARTITION BY author_id ORDER BY id DESC'
+                '    ) AS row_number'
+                f'    FROM {Recipe._meta.db_table}'
+                f'    WHERE author_id IN ({placeholders})'
+                ') AS recipes WHERE row_number <= %s '
+                'ORDER BY id DESC',
+                [*author_ids, limit])
+
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.limited_recipes = recipes_by_author[author.id]
+        return authors
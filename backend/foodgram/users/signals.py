@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.catalog import AUTHORS_CATALOG, bump_catalog_version
+
+from foodgram.counters import get_delta, shift_counter
+
+from .models import Follow, User
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def update_followers_count(sender, instance: Follow, signal,
+                           **kwargs) -> None:
+    """Счетчик подписчиков автора: +1 при подписке, -1 при отписке."""
+    delta = get_delta(signal, **kwargs)
+    if delta:
+        shift_counter(User.objects.filter(id=instance.following_id),
+                      'followers_count', delta)
+
+
+@receiver(post_save, sender=User)
+def bump_authors_version(sender, instance: User, **kwargs) -> None:
+    """
+    Изменились данные пользователя, которые выводятся как автор рецепта -
+    новая версия авторов, закешированные ответы с рецептами неактуальны.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        transaction.on_commit(
+            lambda: bump_catalog_version(AUTHORS_CATALOG))
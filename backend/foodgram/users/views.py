@@ -24,6 +24,7 @@ from .permissions import UserIsAuthenticated
 from .serializers import (ChangePasswordSerializer, InfoSerializer,
                           LoginSerializer, SignupSerializer, SubInfoSerializer,
                           SubscriptionSerializer)
+from .services import UserService
 
 
 class UserViewSet(CreateModelMixin,
@@ -111,7 +112,11 @@ class UserViewSet(CreateModelMixin,
                 user=current_user, following=following)
             if not created:
                 raise CantSubscribe({'errors': 'Нельзя подписаться повторно'})
-            
+
+            following = UserService.get_subscriptions(
+                self, current_user).get(id=following.id)
+            limit = UserService.get_recipes_limit(self, request)
+            UserService.attach_recipes(self, [following], limit)
             serializer = SubInfoSerializer(following,
                                            context={'request': request})
             return Response(serializer.data, HTTP_201_CREATED)
@@ -142,19 +147,20 @@ class UserViewSet(CreateModelMixin,
     def subscriptions(self, request: Request) -> Response:
         """
         Action for get subscriptions:
-            - Получаем список id на которых подписан пользователь.
-              Далее получаем queryset объектов User из этих id.
-              Передаем в пагинацию, а затем сериализуем.
+            - Получаем queryset авторов, на которых подписан пользователь,
+              с количеством их рецептов.
+              Передаем в пагинацию, к странице одним запросом добавляем
+              не больше recipes_limit рецептов каждого автора, а затем
+              сериализуем.
 
             - Права доступа: авторизованные пользователи.
             - requests methods - get
         """
-        user = get_object_or_404(User, username=request.user.username)
-        followed_id_list = user.follower.all().values_list(
-            'following_id', flat=True
-        )
-        followed_users = User.objects.filter(id__in=followed_id_list).all()
-        page = self.paginate_queryset(followed_users)
+        followed_users = UserService.get_subscriptions(self, request.user)
+        page = UserService.attach_recipes(
+            self,
+            self.paginate_queryset(followed_users),
+            UserService.get_recipes_limit(self, request))
         serializer = SubscriptionSerializer(page, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
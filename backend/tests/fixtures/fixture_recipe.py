@@ -0,0 +1,33 @@
+import pytest
+
+from recipes.models import AmountIngredient, Ingredient, Recipe, Tag
+
+
+@pytest.fixture
+def tag():
+    return Tag.objects.create(name='Завтрак', color='#00c000', slug='breakfast')
+
+
+@pytest.fixture
+def ingredient():
+    return Ingredient.objects.create(name='Мука', measurement_unit='г')
+
+
+@pytest.fixture
+def make_recipes(admin, tag, ingredient):
+    def _make_recipes(count, author=admin):
+        recipes = []
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {i}',
+                image='recipes/recipe.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.add(tag)
+            AmountIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=100)
+            recipes.append(recipe)
+        return recipes
+    return _make_recipes
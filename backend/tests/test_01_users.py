@@ -126,3 +126,42 @@ class Test01UserAPI:
             f'Проверьте, что PUT-запрос к `{self.me}` возвращает '
             'ответ со статусом 405.'
         )
+
+    def test_07_subscriptions_recipes_limit(
+            self, user_client, admin, make_recipes,
+            django_assert_max_num_queries):
+        make_recipes(5)
+        response = user_client.post(
+            f'/api/users/{admin.id}/subscribe/?recipes_limit=2')
+        assert response.status_code == HTTPStatus.CREATED
+        assert len(response.json()['recipes']) == 2
+
+        with django_assert_max_num_queries(4):
+            response = user_client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 3})
+        author = response.json()['results'][0]
+        assert len(author['recipes']) == 3, (
+            'Проверьте, что количество рецептов ограничено recipes_limit.'
+        )
+        assert author['recipes_count'] == 5, (
+            'Проверьте, что recipes_count - общее количество рецептов автора.'
+        )
+        assert author['is_subscribed'] is True
+        ids = [recipe['id'] for recipe in author['recipes']]
+        assert ids == sorted(ids, reverse=True)
+
+    def test_08_users_cursor_pagination(self, user_client, user, admin):
+        response = user_client.get('/api/users/', {'cursor': '', 'limit': 1})
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert [item['id'] for item in data['results']] == [user.id]
+        data = user_client.get(data['next']).json()
+        assert [item['id'] for item in data['results']] == [admin.id]
+        assert data['next'] is None
+
+        user_client.post(f'/api/users/{admin.id}/subscribe/')
+        data = user_client.get(
+            '/api/users/subscriptions/', {'cursor': ''}).json()
+        assert [item['id'] for item in data['results']] == [admin.id], (
+            'Проверьте, что ?cursor= работает для подписок.'
+        )
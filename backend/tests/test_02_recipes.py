@@ -1,7 +1,12 @@
+import os
+
 import pytest
 
 from http import HTTPStatus
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 
 @pytest.mark.django_db(transaction=True)
 class Test02RecipeAPI:
@@ -28,4 +33,935 @@ class Test02RecipeAPI:
         assert response.status_code != HTTPStatus.NOT_FOUND, (
             f'Эндпоинт `{self.ingredients_get}` не найден. Проверьте настройки '
             'в *urls.py*.'
-        )
\ No newline at end of file
+        )
+
+    def test_01_recipes_list_constant_queries(self, user_client, make_recipes):
+        from django.core.cache import cache
+
+        make_recipes(2)
+        with CaptureQueriesContext(connection) as small_page:
+            response = user_client.get(self.recipes_get, {'limit': 100})
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['results'][0]['is_favorited'] is False
+
+        make_recipes(20)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large_page:
+            user_client.get(self.recipes_get, {'limit': 100})
+        assert len(small_page) == len(large_page), (
+            f'Проверьте, что количество запросов к БД для `{self.recipes_get}` '
+            'не зависит от количества рецептов на странице.'
+        )
+
+    def test_01_recipe_flags(self, user_client, user, admin, make_recipes):
+        recipe, = make_recipes(1)
+        user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+        user_client.post(f'/api/users/{admin.id}/subscribe/')
+        data = user_client.get(f'{self.recipes_get}{recipe.id}/').json()
+        assert data['is_favorited'] is True
+        assert data['is_in_shopping_cart'] is False
+        assert data['author']['is_subscribed'] is True
+
+    def test_02_cart_ingredients_aggregated(
+            self, user_client, user, make_recipes, django_assert_num_queries):
+        from api.utils import get_cart_ingredients
+
+        for recipe in make_recipes(3):
+            user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+        with django_assert_num_queries(1):
+            ingredients = list(get_cart_ingredients(user))
+        assert len(ingredients) == 1, (
+            'Проверьте, что одинаковые ингредиенты из корзины объединяются.'
+        )
+        assert ingredients[0]['total_amount'] == 300
+        assert ingredients[0]['measurement_unit'] == 'г'
+
+    def test_03_download_shopping_cart_cached(
+            self, user_client, user, make_recipes, settings, tmp_path,
+            monkeypatch):
+        settings.MEDIA_ROOT = tmp_path / 'media'
+        settings.PRIVATE_MEDIA_ROOT = tmp_path / 'private'
+        first, second = make_recipes(2)
+        user_client.post(f'/api/recipes/{first.id}/shopping_cart/')
+
+        response = user_client.get('/api/recipes/download_shopping_cart/')
+        assert response.status_code == HTTPStatus.OK, (
+            'Проверьте, что без брокера celery pdf формируется сразу.'
+        )
+        assert response['Content-Type'] == 'application/pdf'
+
+        import api.tasks
+        monkeypatch.setattr(api.tasks, 'render_shopping_cart', None)
+        response = user_client.get('/api/recipes/download_shopping_cart/')
+        assert response.status_code == HTTPStatus.OK, (
+            'Проверьте, что pdf неизменной корзины не формируется повторно.'
+        )
+
+        monkeypatch.undo()
+        user_client.post(f'/api/recipes/{second.id}/shopping_cart/')
+        user.refresh_from_db()
+        assert user.cart_version == 2
+        response = user_client.get('/api/recipes/download_shopping_cart/')
+        assert response.status_code == HTTPStatus.OK
+        assert os.listdir(
+            tmp_path / 'private' / 'shopping_carts' / str(user.id)
+        ) == ['2.pdf']
+        assert not (tmp_path / 'media' / 'shopping_carts').exists(), (
+            'Проверьте, что pdf корзины не попадает в публичный MEDIA_ROOT.'
+        )
+
+    def test_04_shopping_cart_pdf_pages(self):
+        from io import BytesIO
+
+        from api.pdf import ROWS_PER_PAGE, render_shopping_cart
+
+        output = BytesIO()
+        render_shopping_cart(
+            ({'name': f'Ингредиент {i}', 'measurement_unit': 'г',
+              'total_amount': i} for i in range(ROWS_PER_PAGE * 2 + 1)),
+            output)
+        assert b'/Count 3' in output.getvalue(), (
+            'Проверьте, что длинный список продуктов разбивается на страницы.'
+        )
+
+    @pytest.mark.parametrize('params, headers, content_type', (
+        ({'format': 'txt'}, {}, 'text/plain'),
+        ({'format': 'csv'}, {}, 'text/csv'),
+        ({}, {'HTTP_ACCEPT': 'application/json'}, 'application/json'),
+    ))
+    def test_05_download_shopping_cart_text_formats(
+            self, client, user_client, make_recipes, params, headers,
+            content_type):
+        for recipe in make_recipes(2):
+            user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/', params, **headers)
+        assert response.status_code == HTTPStatus.OK
+        assert response['Content-Type'].startswith(content_type), (
+            'Проверьте, что формат списка покупок выбирается по ?format= '
+            'или заголовку Accept.'
+        )
+        content = b''.join(response.streaming_content).decode()
+        assert 'Мука' in content and '200' in content
+
+        response = client.get(
+            '/api/recipes/download_shopping_cart/', params, **headers)
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert response['Content-Type'] == 'application/json', (
+            'Проверьте, что ошибки списка покупок отдаются как json.'
+        )
+
+    def test_06_filter_tags_modes(self, client, make_recipes, tag):
+        from recipes.models import Tag
+
+        lunch = Tag.objects.create(name='Обед', color='#ff0000', slug='lunch')
+        both, breakfast_only = make_recipes(2)
+        both.tags.add(lunch)
+
+        def ids(params):
+            response = client.get(self.recipes_get, params)
+            assert response.status_code == HTTPStatus.OK
+            return {recipe['id'] for recipe in response.json()['results']}
+
+        assert ids({'tags': ['breakfast', 'lunch']}) == {both.id}, (
+            'Проверьте, что по умолчанию рецепт должен содержать все теги.'
+        )
+        assert ids({'tags': ['breakfast', 'lunch'], 'tags_mode': 'any'}) == {
+            both.id, breakfast_only.id}
+        assert ids({'tags': 'lunch&tags=breakfast'}) == {both.id}
+        assert ids({'tags': 'breakfast'}) == {both.id, breakfast_only.id}
+        assert client.get(
+            self.recipes_get, {'tags_mode': 'none'}
+        ).status_code == HTTPStatus.BAD_REQUEST
+
+    def test_07_engagement_counters(self, user_client, user, admin,
+                                    make_recipes):
+        from django.core.management import call_command
+        from recipes.models import Recipe
+
+        recipe, _ = make_recipes(2)
+        user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+        user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        user_client.post(f'/api/users/{admin.id}/subscribe/')
+        recipe.refresh_from_db()
+        admin.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1), (
+            'Проверьте, что счетчики рецепта меняются при добавлении '
+            'в избранное и корзину.'
+        )
+        assert (admin.recipes_count, admin.followers_count) == (2, 1)
+
+        user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        user_client.delete(f'/api/users/{admin.id}/subscribe/')
+        recipe.refresh_from_db()
+        admin.refresh_from_db()
+        assert recipe.favorites_count == 0
+        assert admin.followers_count == 0
+
+        Recipe.objects.update(favorites_count=5, in_carts_count=0)
+        call_command('reconcile_counters', batch_size=1)
+        recipe.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (0, 1), (
+            'Проверьте, что reconcile_counters исправляет расхождения.'
+        )
+
+        Recipe.objects.update(in_carts_count=0)
+        response = user_client.delete(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        recipe.refresh_from_db()
+        assert recipe.in_carts_count == 0, (
+            'Проверьте, что разошедшийся счетчик не уходит ниже нуля.'
+        )
+
+    def test_08_cursor_pagination(self, client, make_recipes):
+        recipes = make_recipes(5)
+        ids, url = [], f'{self.recipes_get}?cursor=&limit=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            data = response.json()
+            assert 'count' not in data
+            assert not any('COUNT(' in query['sql']
+                           for query in queries.captured_queries), (
+                'Проверьте, что в режиме ?cursor= не выполняется COUNT(*).'
+            )
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        assert ids == sorted((recipe.id for recipe in recipes), reverse=True)
+
+        response = client.get(self.recipes_get, {'page': 2, 'limit': 2})
+        assert response.json()['count'] == 5
+        assert client.get(
+            self.recipes_get, {'cursor': 'abc'}
+        ).status_code == HTTPStatus.NOT_FOUND
+
+    def test_09_estimated_count_pages(self, client, make_recipes,
+                                      monkeypatch):
+        from foodgram import pagination
+
+        recipes = make_recipes(5)
+        monkeypatch.setattr(pagination, 'get_estimated_count', lambda _: 2)
+        monkeypatch.setattr(
+            pagination.RecipePagination, 'count_estimate_threshold', 0)
+
+        response = client.get(self.recipes_get, {'page': 2, 'limit': 2})
+        data = response.json()
+        assert (data['count'], data['count_exact']) == (2, False)
+        assert data['next'] is not None, (
+            'Проверьте, что при оценочном количестве ссылка на следующую '
+            'страницу строится по данным.'
+        )
+        response = client.get(self.recipes_get, {'page': 3, 'limit': 2})
+        assert response.status_code == HTTPStatus.OK, (
+            'Проверьте, что страницы за пределами оценки количества '
+            'доступны.'
+        )
+        assert [recipe['id'] for recipe in response.json()['results']] == [
+            recipes[0].id]
+        assert response.json()['next'] is None
+
+    def test_09_cached_count(self, client, make_recipes):
+        make_recipes(3)
+        response = client.get(self.recipes_get, {'tags': 'breakfast'})
+        assert response.json()['count'] == 3
+        assert response.json()['count_exact'] is True
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                self.recipes_get, {'tags': 'breakfast', 'page': 2, 'limit': 2})
+        assert response.json()['count'] == 3
+        assert not any('COUNT(' in query['sql']
+                       for query in queries.captured_queries), (
+            'Проверьте, что количество рецептов берется из кеша.'
+        )
+
+        make_recipes(1)
+        response = client.get(self.recipes_get, {'tags': 'breakfast'})
+        assert response.json()['count'] == 4, (
+            'Проверьте, что кеш количества сбрасывается при создании рецепта.'
+        )
+
+    def test_10_large_limit_streamed(self, client, make_recipes):
+        import json
+
+        from foodgram.pagination import PagePaginationWithLimit
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+
+        recipes = make_recipes(5)
+        response = client.get(self.recipes_get, {'limit': 3})
+        assert not response.streaming
+
+        response = client.get(self.recipes_get, {'limit': 10 ** 6})
+        assert response.streaming, (
+            'Проверьте, что большие страницы отдаются потоком.'
+        )
+        data = json.loads(b''.join(response.streaming_content))
+        assert data['count'] == 5
+        assert [recipe['id'] for recipe in data['results']] == [
+            recipe.id for recipe in reversed(recipes)]
+        assert data['results'][0]['ingredients'][0]['name'] == 'Мука'
+        request = Request(APIRequestFactory().get('/', {'limit': 10 ** 6}))
+        assert PagePaginationWithLimit().get_page_size(request) == (
+            PagePaginationWithLimit.max_page_size), (
+            'Проверьте, что ?limit= ограничен max_page_size.'
+        )
+
+    def test_11_image_variants(self, client, make_recipes, settings,
+                               tmp_path):
+        from PIL import Image
+
+        settings.MEDIA_ROOT = tmp_path
+        (tmp_path / 'recipes').mkdir()
+        Image.new('RGB', (800, 600), 'red').save(
+            tmp_path / 'recipes' / 'recipe.png')
+
+        recipe, = make_recipes(1)
+        recipe.refresh_from_db()
+        assert recipe.image_variants['source'] == 'recipes/recipe.png', (
+            'Проверьте, что варианты картинки строятся после сохранения '
+            'рецепта.'
+        )
+        assert recipe.image_variants['thumbnail']['width'] == 160
+        assert recipe.image_variants['full']['width'] == 800
+        with Image.open(
+                tmp_path / recipe.image_variants['card']['webp']) as image:
+            assert (image.format, image.size) == ('WEBP', (480, 360))
+
+        data = client.get(f'{self.recipes_get}{recipe.id}/').json()
+        srcset = data['image_srcset']['jpeg'].split(', ')
+        assert [item.split()[1] for item in srcset] == ['160w', '480w', '800w']
+        assert srcset[0].startswith('http://testserver/media/recipes/variants')
+
+    def test_12_image_upload_multipart_and_base64(
+            self, user_client, tag, ingredient, settings, tmp_path):
+        import base64
+        import io
+        import json
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        settings.MEDIA_ROOT = tmp_path
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        image = output.getvalue()
+        data = {
+            'tags': [tag.id],
+            'name': 'Блины',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+        ingredients = [{'id': ingredient.id, 'amount': 100}]
+
+        response = user_client.post(self.recipes_get, {
+            **data,
+            'ingredients': json.dumps(ingredients),
+            'image': SimpleUploadedFile('photo.png', image, 'image/png'),
+        }, format='multipart')
+        assert response.status_code == HTTPStatus.CREATED, (
+            'Проверьте, что рецепт можно создать multipart запросом.'
+        )
+        assert response.json()['ingredients'][0]['amount'] == 100
+
+        base64_image = (
+            f'data:image/png;base64,{base64.b64encode(image).decode()}')
+        response = user_client.post(self.recipes_get, {
+            **data, 'ingredients': ingredients, 'image': base64_image,
+        }, format='json')
+        assert response.status_code == HTTPStatus.CREATED
+
+        settings.MAX_IMAGE_SIZE = len(image) - 1
+        response = user_client.post(self.recipes_get, {
+            **data, 'ingredients': ingredients, 'image': base64_image,
+        }, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert 'image' in response.json()
+        response = user_client.post(self.recipes_get, {
+            **data,
+            'ingredients': json.dumps(ingredients),
+            'image': SimpleUploadedFile('photo.png', image, 'image/png'),
+        }, format='multipart')
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            'Проверьте, что размер multipart картинки ограничен '
+            'MAX_IMAGE_SIZE.'
+        )
+
+    def test_13_image_storage_deduplicated(
+            self, user_client, tag, ingredient, settings, tmp_path):
+        import base64
+        import io
+
+        from django.core.management import call_command
+        from PIL import Image
+
+        settings.MEDIA_ROOT = tmp_path
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        data = {
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 100}],
+            'name': 'Блины',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': ('data:image/png;base64,'
+                      f'{base64.b64encode(output.getvalue()).decode()}'),
+        }
+        for _ in range(2):
+            user_client.post(self.recipes_get, data, format='json')
+        first, second = user_client.get(self.recipes_get).json()['results']
+        assert first['image'] == second['image'], (
+            'Проверьте, что одинаковые картинки хранятся одним файлом.'
+        )
+        images = [path for path in (tmp_path / 'recipes').rglob('*.png')]
+        assert len(images) == 1
+
+        call_command('gc_media', min_age=0)
+        assert images[0].exists(), (
+            'Проверьте, что gc_media не удаляет используемые картинки.'
+        )
+        user_client.delete(f'{self.recipes_get}{first["id"]}/')
+        user_client.delete(f'{self.recipes_get}{second["id"]}/')
+        call_command('gc_media', min_age=0, batch_size=1)
+        assert not images[0].exists()
+        assert not list((tmp_path / 'recipes' / 'variants').rglob('*.*')), (
+            'Проверьте, что gc_media удаляет варианты удаленных картинок.'
+        )
+
+    def test_14_update_recipe_diff(self, user_client, user, tag, ingredient,
+                                   make_recipes):
+        from recipes.models import AmountIngredient, Ingredient
+
+        recipe, = make_recipes(1, author=user)
+        user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        user.refresh_from_db()
+        cart_version = user.cart_version
+        amount_id = AmountIngredient.objects.get(recipe=recipe).id
+        data = {
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 100}],
+            'name': 'Новое название',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            response = user_client.patch(
+                f'{self.recipes_get}{recipe.id}/', data, format='json')
+        assert response.status_code == HTTPStatus.OK
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'DELETE'))
+                  and 'recipes_recipe_fts' not in query['sql']]
+        assert not writes, (
+            'Проверьте, что неизмененные теги и ингредиенты не '
+            'пересоздаются при обновлении рецепта.'
+        )
+        user.refresh_from_db()
+        assert user.cart_version == cart_version
+
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        data['ingredients'] = [{'id': ingredient.id, 'amount': 50},
+                               {'id': salt.id, 'amount': 5}]
+        response = user_client.patch(
+            f'{self.recipes_get}{recipe.id}/', data, format='json')
+        assert response.status_code == HTTPStatus.OK
+        amounts = dict(AmountIngredient.objects.filter(
+            recipe=recipe).values_list('ingredient__name', 'amount'))
+        assert amounts == {'Мука': 50, 'Соль': 5}
+        assert AmountIngredient.objects.filter(id=amount_id).exists(), (
+            'Проверьте, что у измененного ингредиента обновляется количество.'
+        )
+        user.refresh_from_db()
+        assert user.cart_version == cart_version + 1
+        recipe.refresh_from_db()
+        assert recipe.name == 'Новое название'
+
+    def test_15_create_recipe_constant_queries(
+            self, user_client, tag, ingredient, settings, tmp_path):
+        import base64
+        import io
+
+        from PIL import Image
+        from recipes.models import Ingredient, Tag
+
+        settings.MEDIA_ROOT = tmp_path
+        output = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        image = ('data:image/png;base64,'
+                 f'{base64.b64encode(output.getvalue()).decode()}')
+        tags = [tag] + [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}') for i in range(3)]
+        ingredients = [ingredient] + [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)]
+
+        def create(count):
+            with CaptureQueriesContext(connection) as queries:
+                response = user_client.post(self.recipes_get, {
+                    'tags': [tag.id for tag in tags[:count]],
+                    'ingredients': [{'id': ingredient.id, 'amount': 10}
+                                    for ingredient in ingredients[:count]],
+                    'name': 'Блины',
+                    'text': 'Описание',
+                    'cooking_time': 10,
+                    'image': image,
+                }, format='json')
+            assert response.status_code == HTTPStatus.CREATED
+            assert len(response.json()['ingredients']) == count
+            return len(queries)
+
+        assert create(1) == create(4), (
+            'Проверьте, что количество запросов при создании рецепта не '
+            'зависит от количества тегов и ингредиентов.'
+        )
+
+        response = user_client.post(self.recipes_get, {
+            'tags': [tag.id, 998, 999],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+            'name': 'Блины', 'text': 'Описание', 'cooking_time': 10,
+            'image': image,
+        }, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert '998' in str(response.json()['tags'])
+        assert '999' in str(response.json()['tags'])
+
+        response = user_client.post(self.recipes_get, {
+            'tags': [tag.id],
+            'ingredients': [{'id': 998, 'amount': 10},
+                            {'id': 999, 'amount': 10}],
+            'name': 'Блины', 'text': 'Описание', 'cooking_time': 10,
+            'image': image,
+        }, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            'Проверьте, что несуществующие ингредиенты возвращают ошибку 400.'
+        )
+        assert '[998, 999]' in str(response.json()['ingredients'])
+
+        for ingredients in ([5], [{'id': ingredient.id, 'amount': 'abc'}]):
+            response = user_client.post(self.recipes_get, {
+                'tags': [tag.id], 'ingredients': ingredients,
+                'name': 'Блины', 'text': 'Описание', 'cooking_time': 10,
+                'image': image,
+            }, format='json')
+            assert response.status_code == HTTPStatus.BAD_REQUEST, (
+                'Проверьте, что ингредиент не объектом и нечисловое '
+                'количество возвращают ошибку 400.'
+            )
+
+        response = user_client.post(self.recipes_get, {
+            'tags': [tag.id],
+            'ingredients': [{'id': 999, 'amount': 'abc'}],
+            'name': 'Блины', 'text': 'Описание', 'cooking_time': 10,
+            'image': image,
+        }, format='json')
+        assert set(response.json()) == {'ingredients', 'amount'}, (
+            'Проверьте, что ошибки ингредиентов возвращаются все сразу.'
+        )
+
+        response = user_client.post(self.recipes_get, {
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}],
+            'name': 'Блины', 'text': 'Описание', 'cooking_time': 10,
+            'image': 'data:image/png,iVBORw0KGgo',
+        }, format='json')
+        assert response.status_code == HTTPStatus.BAD_REQUEST, (
+            'Проверьте, что data:image без ;base64, возвращает ошибку 400.'
+        )
+        assert 'image' in response.json()
+
+    def test_16_recipes_dump_load(self, admin, make_recipes, tmp_path):
+        import json
+
+        from django.core.management import call_command
+        from recipes.models import LoadCheckpoint, Recipe
+
+        make_recipes(3)
+        dump = tmp_path / 'recipes.ndjson'
+        call_command('recipes_dump', output=str(dump))
+        records = [json.loads(line) for line in dump.read_text().splitlines()]
+        assert len(records) == 3
+        assert records[0]['tags'] == ['breakfast']
+        assert records[0]['ingredients'] == [
+            {'name': 'Мука', 'measurement_unit': 'г', 'amount': 100}]
+
+        Recipe.objects.all().delete()
+        call_command('recipes_load', str(dump), chunk_size=2)
+        recipe = Recipe.objects.order_by('id').first()
+        assert Recipe.objects.count() == 3, (
+            'Проверьте, что recipes_load загружает выгрузку recipes_dump.'
+        )
+        assert [tag.slug for tag in recipe.tags.all()] == ['breakfast']
+        assert recipe.amountingredient_set.get().amount == 100
+        admin.refresh_from_db()
+        assert admin.recipes_count == 3
+        assert not LoadCheckpoint.objects.exists()
+
+        Recipe.objects.all().delete()
+        LoadCheckpoint.objects.create(name=str(dump), lines=2)
+        call_command('recipes_load', str(dump), chunk_size=2)
+        assert list(Recipe.objects.values_list('name', flat=True)) == [
+            records[2]['name']], (
+            'Проверьте, что recipes_load продолжает загрузку с места '
+            'остановки.'
+        )
+
+        Recipe.objects.all().delete()
+        del records[0]['name']
+        dump.write_text('\n'.join(
+            json.dumps(record, ensure_ascii=False) for record in records))
+        call_command('recipes_load', str(dump), chunk_size=2)
+        assert Recipe.objects.count() == 2, (
+            'Проверьте, что строка без обязательных полей пропускается.'
+        )
+
+    def test_17_recipes_search(self, client, make_recipes, ingredient):
+        from django.core.management import call_command
+        from recipes.models import Ingredient, Recipe
+
+        first, second, third = make_recipes(3)
+        Recipe.objects.filter(id=second.id).update(
+            text='Нужна свежая капуста')
+        Recipe.objects.filter(id=third.id).update(name='Капустный пирог')
+        call_command('reindex_recipes', batch_size=2)
+
+        def search(query):
+            response = client.get(f'{self.recipes_get}?search={query}')
+            assert response.status_code == HTTPStatus.OK
+            return [recipe['id'] for recipe in response.json()['results']]
+
+        assert search('капуст') == [third.id, second.id], (
+            'Проверьте, что поиск находит рецепты по началу слова и '
+            'сначала отдает самые релевантные.'
+        )
+        assert len(search('мука')) == 3, (
+            'Проверьте, что поиск находит рецепты по ингредиентам.'
+        )
+        assert len(search('завтрак')) == 3, (
+            'Проверьте, что поиск находит рецепты по тегам.'
+        )
+        assert search('борщ') == []
+
+        Ingredient.objects.filter(id=ingredient.id).update(name='Ячмень')
+        ingredient.refresh_from_db()
+        ingredient.save()
+        assert len(search('ячмень')) == 3, (
+            'Проверьте, что переименование ингредиента обновляет поиск.'
+        )
+        first.delete()
+        assert len(search('ячмень')) == 2
+
+    def test_18_recipes_feed(self, user_client, user, admin, make_recipes,
+                             django_user_model, settings):
+        from recipes.models import Recipe
+        from users.models import Follow
+
+        other = django_user_model.objects.create_user(
+            username='other', email='other@foodgram.fake', password='1234567')
+        old, *recipes = make_recipes(3)
+        make_recipes(1, author=other)
+        Follow.objects.create(user=user, following=admin)
+
+        response = user_client.get(f'{self.recipes_get}feed/?limit=2')
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        assert [recipe['id'] for recipe in data['results']] == [
+            recipe.id for recipe in reversed(recipes)], (
+            'Проверьте, что лента содержит рецепты авторов из подписок, '
+            'новые первыми.'
+        )
+        response = user_client.get(data['next'])
+        assert [recipe['id'] for recipe in response.json()['results']] == [
+            old.id]
+        assert response.json()['next'] is None
+
+        new, = make_recipes(1)
+        response = user_client.get(f'{self.recipes_get}feed/?limit=1')
+        assert response.json()['results'][0]['id'] == new.id, (
+            'Проверьте, что новый рецепт попадает в ленту подписчиков.'
+        )
+
+        settings.FEED_LENGTH = 2
+        Follow.objects.create(user=user, following=other)
+        response = user_client.get(f'{self.recipes_get}feed/?limit=10')
+        assert len(response.json()['results']) == Recipe.objects.count(), (
+            'Проверьте, что после конца хранимой ленты рецепты '
+            'выбираются запросом.'
+        )
+
+        settings.FEED_MAX_FOLLOWING = 0
+        Follow.objects.filter(following=other).delete()
+        response = user_client.get(f'{self.recipes_get}feed/?limit=10')
+        assert len(response.json()['results']) == 4
+
+    def test_19_recipes_rankings(self, client, user, admin, make_recipes):
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from recipes.models import Favorite, ShoppingCart
+        from recipes.tasks import refresh_recipe_rankings
+
+        first, second, third = make_recipes(3)
+        old = timezone.now() - timedelta(days=30)
+        Favorite.objects.create(user=user, recipe=first, created=old)
+        Favorite.objects.create(user=admin, recipe=first, created=old)
+        ShoppingCart.objects.create(user=user, recipe=first, created=old)
+        Favorite.objects.create(user=user, recipe=second)
+
+        assert refresh_recipe_rankings() == 3
+        assert refresh_recipe_rankings() == 0, (
+            'Проверьте, что пересчет записывает только изменившиеся '
+            'рейтинги.'
+        )
+
+        response = client.get(f'{self.recipes_get}?ordering=popular')
+        assert response.status_code == HTTPStatus.OK
+        assert [recipe['id'] for recipe in response.json()['results']] == [
+            first.id, second.id, third.id], (
+            'Проверьте, что ?ordering=popular сортирует рецепты по '
+            'количеству добавлений за все время.'
+        )
+        for params in ({'ordering': 'popular'}, {'search': 'рецепт'}):
+            response = client.get(self.recipes_get, {**params, 'cursor': ''})
+            assert response.status_code == HTTPStatus.BAD_REQUEST, (
+                'Проверьте, что ?cursor= отклоняется для сортировки не '
+                'по id.'
+            )
+        response = client.get(f'{self.recipes_get}trending/')
+        assert response.status_code == HTTPStatus.OK
+        assert [recipe['id'] for recipe in response.json()['results']] == [
+            second.id], (
+            'Проверьте, что trending учитывает только добавления за '
+            'последнее время.'
+        )
+
+    def test_20_anonymous_response_cache(self, client, admin,
+                                         make_recipes):
+        from recipes.models import AmountIngredient
+
+        recipe, = make_recipes(1)
+        urls = (f'{self.recipes_get}?limit=1&tags=breakfast',
+                f'{self.recipes_get}{recipe.id}/')
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            with CaptureQueriesContext(connection) as queries:
+                cached = client.get(url)
+            assert cached.json() == response.json()
+            assert not queries.captured_queries, (
+                'Проверьте, что повторный анонимный запрос рецептов '
+                'отдается из кеша без запросов к БД.'
+            )
+
+        amount = AmountIngredient.objects.get(recipe=recipe)
+        amount.amount = 250
+        amount.save()
+        for url in urls:
+            data = client.get(url).json()
+            data = data['results'][0] if 'results' in data else data
+            assert data['ingredients'][0]['amount'] == 250, (
+                'Проверьте, что изменение ингредиентов рецепта сбрасывает '
+                'кеш ответов.'
+            )
+
+        admin.first_name = 'Новое имя'
+        admin.save()
+        assert client.get(urls[1]).json()['author']['first_name'] == (
+            'Новое имя'), (
+            'Проверьте, что изменение профиля автора сбрасывает кеш ответов.'
+        )
+
+    def test_21_user_state_overlay(self, client, user_client, admin,
+                                   make_recipes):
+        recipe, = make_recipes(1)
+        url = f'{self.recipes_get}{recipe.id}/'
+        user_client.post(f'{url}favorite/')
+        user_client.post(f'/api/users/{admin.id}/subscribe/')
+        assert client.get(url).json()['is_favorited'] is False
+
+        user_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            data = user_client.get(url).json()
+        assert (data['is_favorited'], data['is_in_shopping_cart'],
+                data['author']['is_subscribed']) == (True, False, True), (
+            'Проверьте, что флаги пользователя накладываются на общий '
+            'закешированный ответ.'
+        )
+        assert not any('recipes_recipe' in query['sql']
+                       for query in queries.captured_queries), (
+            'Проверьте, что авторизованный пользователь получает рецепт '
+            'из общего кеша.'
+        )
+
+        user_client.delete(f'{url}favorite/')
+        user_client.post(f'{url}shopping_cart/')
+        user_client.delete(f'/api/users/{admin.id}/subscribe/')
+        data = user_client.get(url).json()
+        assert (data['is_favorited'], data['is_in_shopping_cart'],
+                data['author']['is_subscribed']) == (False, True, False), (
+            'Проверьте, что избранное, корзина и подписки пользователя '
+            'сбрасываются из кеша при изменении.'
+        )
+        data = user_client.get(
+            f'{self.recipes_get}?is_in_shopping_cart=1').json()
+        assert [item['id'] for item in data['results']] == [recipe.id]
+
+    def test_22_user_state_stale_write(self, user, make_recipes):
+        from django.core.cache import cache
+        from recipes.catalog import get_catalog_versions
+        from recipes.models import Favorite
+        from recipes.user_state import (FAVORITES, get_user_state,
+                                        get_user_state_catalog)
+
+        recipe, = make_recipes(1)
+        catalog = get_user_state_catalog(user.id, FAVORITES)
+        stale_version, = get_catalog_versions([catalog])
+        Favorite.objects.create(user=user, recipe=recipe)
+        cache.set(f'{catalog}:{stale_version}', set())
+        assert get_user_state(user.id)[FAVORITES] == {recipe.id}, (
+            'Проверьте, что множество, записанное запросом до изменения, '
+            'не читается после него.'
+        )
+
+    def test_23_feed_timeline_lock(self, user, admin, make_recipes,
+                                   monkeypatch):
+        from django.core.cache import cache
+        from recipes import feed
+        from users.models import Follow
+
+        recipe, = make_recipes(1)
+        Follow.objects.create(user=user, following=admin)
+        key = feed.get_timeline_key(user.id)
+        assert feed.get_timeline(user.id) == [recipe.id]
+
+        monkeypatch.setattr(feed, 'FEED_LOCK_TIMEOUT', 0.05)
+        cache.add(f'{key}:lock', 1, 60)
+        new, = make_recipes(1)
+        assert cache.get(key) is None, (
+            'Проверьте, что ленту, которую fan-out не смог заблокировать, '
+            'он сбрасывает, а не теряет вставку.'
+        )
+        assert feed.get_timeline(user.id) == [new.id, recipe.id]
+        assert cache.get(key) is None, (
+            'Проверьте, что без блокировки собранная лента не пишется в кеш.'
+        )
+
+        cache.delete(f'{key}:lock')
+        feed.get_timeline(user.id)
+        newest, = make_recipes(1)
+        assert cache.get(key) == [newest.id, new.id, recipe.id]
+
+    def test_24_shopping_cart_task_dedupe(self, user_client, user,
+                                          make_recipes, settings, tmp_path,
+                                          monkeypatch):
+        import api.views
+        from api.tasks import build_shopping_cart
+
+        settings.PRIVATE_MEDIA_ROOT = tmp_path
+        recipe, = make_recipes(1)
+        user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        calls = []
+
+        class PendingResult:
+            status = 'PENDING'
+
+            def __init__(self, task_id, **kwargs):
+                self.id = task_id
+
+            def ready(self):
+                return False
+
+            def failed(self):
+                return False
+
+        def apply_async(args, task_id):
+            calls.append(args)
+            return PendingResult(task_id)
+
+        monkeypatch.setattr(build_shopping_cart, 'apply_async', apply_async)
+        monkeypatch.setattr(api.views, 'AsyncResult', PendingResult)
+        first = user_client.get('/api/recipes/download_shopping_cart/')
+        second = user_client.get('/api/recipes/download_shopping_cart/')
+        assert first.status_code == HTTPStatus.ACCEPTED
+        assert first.json() == second.json(), (
+            'Проверьте, что повторный запрос получает ссылку на ту же задачу.'
+        )
+        assert calls == [(user.id, 1)], (
+            'Проверьте, что на версию корзины ставится одна задача.'
+        )
+        response = user_client.get(first.json()['status_url'])
+        assert response.status_code == HTTPStatus.ACCEPTED
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/unknown/')
+        assert response.status_code == HTTPStatus.NOT_FOUND, (
+            'Проверьте, что статус неизвестной задачи не висит в 202.'
+        )
+
+        monkeypatch.undo()
+        build_shopping_cart(user.id, 2)
+        build_shopping_cart(user.id, 1)
+        files = os.listdir(tmp_path / 'shopping_carts' / str(user.id))
+        assert sorted(files) == ['1.pdf', '2.pdf'], (
+            'Проверьте, что запоздавшая задача старой версии не удаляет '
+            'файл новой.'
+        )
+
+    def test_25_catalog_version_bumped_on_commit(self, make_recipes):
+        from django.db import transaction
+        from recipes.catalog import RECIPES_CATALOG, get_catalog_version
+
+        version = get_catalog_version(RECIPES_CATALOG)
+        with transaction.atomic():
+            make_recipes(1)
+            assert get_catalog_version(RECIPES_CATALOG) == version, (
+                'Проверьте, что версия рецептов не меняется до коммита: '
+                'иначе под новой версией закешируются старые данные.'
+            )
+        assert get_catalog_version(RECIPES_CATALOG) != version
+
+    def test_26_engagement_counters_in_api(self, client, user_client, admin,
+                                           make_recipes):
+        recipe, = make_recipes(1)
+        url = f'/api/recipes/{recipe.id}/'
+        assert client.get(url).json()['favorites_count'] == 0
+
+        response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+        assert response.json()['favorites_count'] == 1, (
+            'Проверьте, что ответ на добавление в избранное содержит '
+            'обновленный счетчик.'
+        )
+        response = user_client.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.json()['in_carts_count'] == 1
+        data = client.get(url).json()
+        assert (data['favorites_count'], data['in_carts_count']) == (1, 1), (
+            'Проверьте, что закешированный ответ с рецептом сбрасывается '
+            'при изменении избранного и корзин.'
+        )
+
+        response = user_client.post(f'/api/users/{admin.id}/subscribe/')
+        assert response.json()['followers_count'] == 1
+        response = user_client.get(f'/api/users/{admin.id}/')
+        assert response.json()['followers_count'] == 1
+
+    def test_27_feed_lock_release(self, user):
+        from django.core.cache import cache
+        from recipes import feed
+
+        key = f'{feed.get_timeline_key(user.id)}:lock'
+        with feed.timeline_lock(user.id, 0) as locked:
+            assert locked
+            cache.set(key, 'other', 60)
+        assert cache.get(key) == 'other', (
+            'Проверьте, что истекшая блокировка не снимает блокировку, '
+            'взятую другим процессом.'
+        )
+        cache.delete(key)
+        with feed.timeline_lock(user.id, 0):
+            pass
+        assert cache.get(key) is None
@@ -0,0 +1,117 @@
+import pytest
+
+from http import HTTPStatus
+
+from recipes.models import Ingredient
+
+
+@pytest.mark.django_db(transaction=True)
+class Test05CatalogAPI:
+    ingredients_url = '/api/ingredients/'
+
+    @pytest.fixture
+    def ingredients(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'мука', 'мука пшеничная', 'рисовая мука', 'молоко',
+                'мускатный орех', 'сахар',
+            ))
+        Ingredient.objects.create(name='Мускус', measurement_unit='г')
+
+    def test_00_autocomplete_ranking(self, client, ingredients):
+        response = client.get(self.ingredients_url, {'name': 'МУК'})
+        assert response.status_code == HTTPStatus.OK
+        names = [item['name'] for item in response.json()]
+        assert names[:3] == ['мука', 'мука пшеничная', 'рисовая мука'], (
+            'Проверьте, что сначала выдаются совпадения с началом названия, '
+            'затем вхождения подстроки.'
+        )
+        assert 'Мускус' in names, (
+            'Проверьте, что поиск ингредиентов допускает опечатки.'
+        )
+
+    def test_01_autocomplete_limit(self, client, ingredients):
+        response = client.get(self.ingredients_url, {'name': 'м', 'limit': 2})
+        assert len(response.json()) == 2
+
+    def test_02_autocomplete_without_db(
+            self, client, ingredients, django_assert_max_num_queries):
+        client.get(self.ingredients_url, {'name': 'мук'})
+        with django_assert_max_num_queries(0):
+            response = client.get(self.ingredients_url, {'name': 'сах'})
+        assert response.json()[0]['name'] == 'сахар'
+
+    def test_03_autocomplete_rebuilt_on_change(self, client, ingredients):
+        client.get(self.ingredients_url, {'name': 'сах'})
+        Ingredient.objects.create(name='сахарная пудра', measurement_unit='г')
+        names = [item['name'] for item in client.get(
+            self.ingredients_url, {'name': 'сах'}).json()]
+        assert 'сахарная пудра' in names, (
+            'Проверьте, что индекс ингредиентов перестраивается после '
+            'изменения справочника.'
+        )
+
+    @pytest.mark.parametrize('url', ('/api/ingredients/', '/api/tags/'))
+    def test_04_catalog_conditional_get(
+            self, client, ingredients, tag, url,
+            django_assert_max_num_queries):
+        response = client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        etag = response['ETag']
+        assert etag and response['Last-Modified'], (
+            f'Проверьте, что `{url}` отдает заголовки ETag и Last-Modified.'
+        )
+
+        with django_assert_max_num_queries(0):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == HTTPStatus.NOT_MODIFIED, (
+            f'Проверьте, что условный GET к `{url}` с актуальным ETag '
+            'возвращает 304.'
+        )
+
+        with django_assert_max_num_queries(0):
+            cached = client.get(url)
+        assert cached.json() == client.get(url).json()
+
+    def test_05_catalog_version_bumped(self, client, tag):
+        etag = client.get('/api/tags/')['ETag']
+        tag.name = 'Обед'
+        tag.save()
+        response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == HTTPStatus.OK, (
+            'Проверьте, что после изменения тега меняется ETag справочника.'
+        )
+        assert response.json()[0]['name'] == 'Обед'
+
+    def test_06_import_data_idempotent(self, monkeypatch, settings):
+        import csv
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        monkeypatch.chdir(settings.BASE_DIR)
+        Ingredient.objects.create(
+            name='абрикосовое варенье', measurement_unit='г')
+
+        output = StringIO()
+        call_command('import_data', load=True, chunk_size=500, stdout=output)
+        total = Ingredient.objects.count()
+        assert total > 1000
+        assert f'добавлено {total - 1}, обновлено 0, без изменений 1' in (
+            output.getvalue())
+        with open('static/data/ingredients.csv', encoding='utf-8') as file:
+            rows = list(dict.fromkeys(
+                tuple(row) for row in csv.reader(file)))
+        assert list(Ingredient.objects.order_by('id').values_list(
+            'name', 'measurement_unit'))[1:] == [
+            row for row in rows if row != ('абрикосовое варенье', 'г')], (
+            'Проверьте, что ингредиенты добавляются в порядке csv файла.'
+        )
+
+        output = StringIO()
+        call_command('import_data', load=True, stdout=output)
+        assert Ingredient.objects.count() == total, (
+            'Проверьте, что повторный import_data --load не создает дубли.'
+        )
+        assert f'добавлено 0, обновлено 0, без изменений {total}' in (
+            output.getvalue())
@@ -1,3 +1,6 @@
+const DOWNLOAD_POLL_ATTEMPTS = 30
+const DOWNLOAD_POLL_DELAY = 1000
+
 class Api {
   constructor (url, headers) {
     this._url = url
@@ -14,8 +17,20 @@ class Api {
     })
   }
 
-  checkFileDownloadResponse (res) {
+  checkFileDownloadResponse (res, attempt = 0) {
     return new Promise((resolve, reject) => {
+      if (res.status === 202) {
+        // pdf is rendered in background, poll status_url until it is ready
+        return res.json().then(({ status_url = res.url }) => {
+          if (attempt >= DOWNLOAD_POLL_ATTEMPTS) {
+            return reject()
+          }
+          setTimeout(
+            () => this.downloadFile(status_url, attempt + 1).then(resolve, reject),
+            DOWNLOAD_POLL_DELAY
+          )
+        })
+      }
       if (res.status < 400) {
         return res.blob().then(blob => {
           const url = window.URL.createObjectURL(blob);
@@ -113,7 +128,7 @@ class Api {
   } = {}) {
       const token = localStorage.getItem('token')
       const authorization = token ? { 'authorization': `Token ${token}` } : {}
-      const tagsString = tags ? tags.filter(tag => tag.value).map(tag => `&tags=${tag.slug}`).join('') : ''
+      const tagsString = tags ? tags.filter(tag => tag.value).map(tag => `&tags=${tag.slug}`).join('') + '&tags_mode=any' : ''
       return fetch(
         `/api/recipes/?page=${page}&limit=${limit}${author ? `&author=${author}` : ''}${is_favorited ? `&is_favorited=${is_favorited}` : ''}${is_in_shopping_cart ? `&is_in_shopping_cart=${is_in_shopping_cart}` : ''}${tagsString}`,
         {
@@ -385,10 +400,10 @@ class Api {
     ).then(this.checkResponse)
   }
 
-  downloadFile () {
+  downloadFile (url = `/api/recipes/download_shopping_cart/`, attempt = 0) {
     const token = localStorage.getItem('token')
     return fetch(
-      `/api/recipes/download_shopping_cart/`,
+      url,
       {
         method: 'GET',
         headers: {
@@ -396,7 +411,7 @@ class Api {
           'authorization': `Token ${token}`
         }
       }
-    ).then(this.checkFileDownloadResponse)
+    ).then(res => this.checkFileDownloadResponse(res, attempt))
   }
 }
 